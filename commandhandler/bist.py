@@ -80,6 +80,12 @@ class Scope:
         record.file_object.write('Low,high,vco,delay\n')
         record.file_object.write('%d,%d,%d,%d\n' % (self.low_time,self.high_time,self.vco_phase,self.counter_phase))
         
+        if isinstance(record, VerticalRecordMonotonic):
+            # Thresholds known in advance: the whole sweep runs in the FPGA server
+            for probT, probA, probB, probC in self.handler.bist_sweep(record.th_range[0], record.th_range[1], record.step):
+                record.save_point(probT, probA, probB, probC)
+            return
+        
         for thA, thB, thC in record:
         
             self.handler.write_reg(mmap.SCN, 0)
@@ -88,10 +94,8 @@ class Scope:
             
             self.handler.write_reg(mmap.SCN, mmap.SCN_RUN_CAPTURE)
             
-            n_tries = 100
-            while not (self.handler.read_reg(mmap.SCF) & mmap.SCF_CAPTURE_DONE):
-                n_tries -= 1
-                if not n_tries: raise IOError
+            done, flags, elapsed = self.handler.wait_reg(mmap.SCF, mmap.SCF_CAPTURE_DONE, mmap.SCF_CAPTURE_DONE, timeout=options.BIST_CAPTURE_TIMEOUT)
+            if not done: raise IOError
             
             lsbT, msbT, lsbA, msbA, lsbB, msbB, lsbC, msbC = self.handler.read_reg(mmap.SCTa, 8)
             
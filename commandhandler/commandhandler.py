@@ -133,12 +133,11 @@ def set_hk_ch_period(new_period):
     socket_hk_control.send(raw)
 
 def initialize_cal_laser():
-    #Make sure heaters are on
-    if(fpga.read_reg(mmap.PO3) != 85):
-        power.heaters_on()
-    #Make sure cal laser diode is on
-    if(fpga.read_reg(mmap.CAL) != 85):
-        power.calib_diode_on()
+    #Make sure heaters, then cal laser diode, are on. Checked and switched by the FPGA server in one exchange
+    fpga.macro() \
+        .read(mmap.PO3).branch_eq(85, 'heaters_on').write(mmap.PO3, 85).label('heaters_on') \
+        .read(mmap.CAL).branch_eq(85, 'diode_on').write(mmap.CAL, 85).label('diode_on') \
+        .run()
     log_to_hk('CALIBRATION LASER ON')
     #Set DAC
     fpga.write_reg(mmap.DAC_SETUP,1)
@@ -626,8 +625,12 @@ while True:
             if(num_registers != len(write_data)):
                 log_to_hk('ERROR CMD PL_SET_FPGA - Packet Error: expected number of registers (= ' + str(num_registers) +  ' not equal to data length (= ' + str(len(write_data)))
             else:
-                fpga.write_reg(start_addr, write_data)
-                check_write_data = fpga.read_reg(start_addr, num_registers)
+                #Write and read back in one exchange, no other client can write in between
+                #Macro reads go to the FPGA, not to the server cache of the config registers
+                set_macro = fpga.macro()
+                for i in range(num_registers): set_macro.write(start_addr+i, write_data[i])
+                for i in range(num_registers): set_macro.read(start_addr+i)
+                check_write_data = [value for addr, value in set_macro.run()]
                 if(type(check_write_data) == int):
                     check_write_data = [check_write_data]
                 if(type(check_write_data) == list):
@@ -765,14 +768,19 @@ while True:
             set_hk_ch_period(2*temp_sleep_time) #delay heartbeat period from default 10 sec to twice the sleep time
             counter_heartbeat = send_heartbeat(time.time(), counter_heartbeat)
             begin_time = time.time()
-            while(temps < 0):
-                temps = sum([fpga.read_reg(reg) for reg in mmap.TEMPERATURE_BLOCK])/6
-                counter_heartbeat = send_heartbeat(time.time(), counter_heartbeat)
-                time.sleep(temp_sleep_time)
-                print(temps)
-                if ((time.time() - begin_time) > 1200):
-                    log_to_hk("Heater time reached 15 minutes and avg temps: %s" % sum([fpga.read_reg(reg) for reg in mmap.TEMPERATURE_BLOCK])/6)
-                    print("Heater time reached 15 minutes and avg temps: %s" % sum([fpga.read_reg(reg) for reg in mmap.TEMPERATURE_BLOCK])/6)
+            if (temps < 0):
+                #Only subscribed while heating, the server stops sampling once the stream is closed
+                temps_stream = fpga.subscribe(mmap.TEMPERATURE_BLOCK, temp_sleep_time) #server samples the temperatures once per period
+                try:
+                    while(temps < 0):
+                        temps = sum(temps_stream.recv()[1])/6
+                        counter_heartbeat = send_heartbeat(time.time(), counter_heartbeat)
+                        print(temps)
+                        if ((time.time() - begin_time) > 1200):
+                            log_to_hk("Heater time reached 15 minutes and avg temps: %s" % sum([fpga.read_reg(reg) for reg in mmap.TEMPERATURE_BLOCK])/6)
+                            print("Heater time reached 15 minutes and avg temps: %s" % sum([fpga.read_reg(reg) for reg in mmap.TEMPERATURE_BLOCK])/6)
+                finally:
+                    temps_stream.close()
 
 
             fpga.write_reg(mmap.PO3, 15)
@@ -832,11 +840,8 @@ while True:
             tx_packet.seed_align(seed)
             log_to_hk("turned edfa on")            
 
-            fpga.write_reg(mmap.EDFA_IN_STR ,'mode acc\r')
-            time.sleep(0.1)
-            fpga.write_reg(mmap.EDFA_IN_STR ,'ldc ba 2200\r')
-            time.sleep(0.1)
-            fpga.write_reg(mmap.EDFA_IN_STR ,'edfa on\r')
+            # Queued back-to-back by the FPGA server, each future completes with the EDFA reply
+            fpga.wait_all(*[fpga.edfa.send_command_async(cmd) for cmd in ('mode acc\r','ldc ba 2200\r','edfa on\r')])
             time.sleep(2)
 
             #set points are dependent on temperature
@@ -851,7 +856,8 @@ while True:
                 # # #Write to FIFO
                 tx_pkt.transmit(fpga, .1)
 
-                fifo_len = fpga.read_reg(47)*256+fpga.read_reg(48)
+                fifo_msb, fifo_lsb = fpga.read_regs([47, 48])
+                fifo_len = fifo_msb*256+fifo_lsb
                 if(len(tx_pkt.symbols) != fifo_len): #Why is the empty fifo length 2
                     # success = False
                     print("Fifo length %s does not match packet symbol length %s " % (fifo_len, len(tx_pkt.symbols)))
@@ -894,8 +900,12 @@ while True:
             if(num_registers != len(write_data)):
                 log_to_hk('ERROR CMD PL_SET_FPGA - Packet Error: expected number of registers (= ' + str(num_registers) +  ' not equal to data length (= ' + str(len(write_data)))
             else:
-                fpga.write_reg(start_addr, write_data)
-                check_write_data = fpga.read_reg(start_addr, num_registers)
+                #Write and read back in one exchange, no other client can write in between
+                #Macro reads go to the FPGA, not to the server cache of the config registers
+                set_macro = fpga.macro()
+                for i in range(num_registers): set_macro.write(start_addr+i, write_data[i])
+                for i in range(num_registers): set_macro.read(start_addr+i)
+                check_write_data = [value for addr, value in set_macro.run()]
                 addresses = range(start_addr, start_addr+num_registers)
                 return_message = ""
                 num_errors = 0
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import time
+import options
+import fpga_map as mmap
+import ipc_packets
+import edfa
+
+# Registers of the scan: the EDFA ones, as it reads the input power, and the seed TEC
+REGISTERS = edfa.REGISTERS + [mmap.SEED_ALIGN, mmap.LTSa, mmap.LTSb, mmap.LTRa, mmap.LTRb]
+
+def _score(power, band_low, band_high):
+    '''Higher is better: closeness to the middle of the band, or the power itself without a band'''
+    if band_low >= band_high: return power
+    return -abs(power - (band_low + band_high)/2.0)
+
+def _best(curve, center, band_low, band_high):
+    '''Best measured setpoint, the closest to center among equals'''
+    return max(curve, key=lambda setpoint: (_score(curve[setpoint], band_low, band_high), -abs(setpoint - center)))
+
+def _in_band(power, band_low, band_high):
+    return band_low >= band_high or band_low < power < band_high
+
+def scan(req, fpgabus, sampler, access, center, window, band_low, band_high):
+    '''Job searching the seed laser TEC setpoint on the EDFA input power.
+    A first pass measures every ALIGN_COARSE_STEP setpoints of center +/- window, each refining pass
+    halves the step around the best point, down to single setpoints.
+    After each setpoint the TEC readback is polled until it has stayed within ALIGN_SETTLE_TOL codes
+    for ALIGN_SETTLE_WINDOW: it only tracks the setpoint within a few percent. Then ALIGN_AVERAGE fresh
+    EDFA fline readings are averaged. The best setpoint is applied before answering.
+    access(addresses, rw_flag, values) runs one planned request and returns (error count, values).
+    Answers req with an FPGAAlignResultPacket.'''
+    lowest = max(0, center - window)
+    highest = min(0xFFFF, center + window)
+    step = max(1, options.ALIGN_COARSE_STEP)
+    todo = range(lowest, highest+1, step)
+    curve = {}
+    error = 0
+
+    while not error:
+        for setpoint in todo:
+
+            # Apply the setpoint and wait for the TEC readback to settle
+            error = access([mmap.LTSa, mmap.LTSb], 1, [setpoint//256, setpoint%256])[0]
+            if error: break
+            start = time.time()
+            readbacks = []
+            while time.time() - start < options.ALIGN_SETTLE_TIMEOUT:
+                yield options.ALIGN_SETTLE_PD
+                error, values = access([mmap.LTRa, mmap.LTRb], 0, [0, 0])
+                if error: break
+                now = time.time()
+                readbacks.append((now, values[0]*256 + values[1]))
+                recent = [readback for stamp, readback in readbacks if now - stamp <= options.ALIGN_SETTLE_WINDOW]
+                if now - start >= options.ALIGN_SETTLE_WINDOW and max(recent) - min(recent) <= options.ALIGN_SETTLE_TOL: break
+            if error: break
+
+            # Fresh EDFA readings, the background sampler stays off the UART meanwhile
+            powers = []
+            for idx in range(options.ALIGN_AVERAGE):
+                sampler.hold(req)
+                edfa.fline_request(fpgabus)
+                yield options.EDFA_READ_WRITE_DELAY
+                try: powers.append(edfa.parse({}, edfa.fline_reply(fpgabus).split())[mmap.EDFA_POWER_IN])
+                except ValueError: pass
+            if powers: curve[setpoint] = sum(powers)/len(powers)
+
+        if error or step == 1: break
+        best = _best(curve, center, band_low, band_high)
+        step = max(1, step//2)
+        todo = [setpoint for setpoint in (best-step, best+step) if lowest <= setpoint <= highest and setpoint not in curve]
+
+    sampler.release(req)
+    if error or not curve:
+        req.answer('',error_flag=1)
+        return
+
+    best = _best(curve, center, band_low, band_high)
+    error = access([mmap.LTSa, mmap.LTSb], 1, [best//256, best%256])[0]
+    result = ipc_packets.FPGAAlignResultPacket()
+    req.answer(result.encode(int(_in_band(curve[best], band_low, band_high)), best, sorted(curve.items())), int(bool(error)))
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import time
+import options
+import ipc_packets
+import reg_codec
+
+def wait(req, addr, mask, value, period, timeout, access):
+    '''Job polling addr until addr & mask == value, or timeout seconds.
+    access(addresses, rw_flag, values) runs one planned request and returns (error count, values).
+    Answers req with an FPGAWaitResultPacket of the outcome, the last value read and the time it took.'''
+    period = max(period, options.WAIT_COND_MIN_PERIOD)
+    timeout = min(timeout, options.WAIT_COND_MAX_TIMEOUT)
+    start = time.time()
+    while 1:
+        error, values = access([addr], 0, [0])
+        if error: break
+        matched = (int(values[0]) & mask) == (value & mask)
+        elapsed = time.time() - start
+        if matched or elapsed >= timeout: break
+        yield period
+
+    if error:
+        req.answer('',error_flag=1)
+        return
+    read_data = reg_codec.list_codec([addr]).encode(values[:1])
+    result = ipc_packets.FPGAWaitResultPacket()
+    req.answer(result.encode(int(matched), elapsed, read_data))
@@ -100,4 +100,21 @@ def write_and_update(fpgabus, target_chan, value):
     else:               target_dac = 2
     addr = (target_chan%4 & 0b11) << 16
     write_command(fpgabus, target_dac, DAC_WRITE_UPDATE_ONE | addr | value)
-    
\ No newline at end of file
+    
+"""
+Write a setpoint of the FSM DAC in one transfer
+values: list of (target_chan 4-7, value)
+The channels are written to the input registers, the last one updates them all, so the mirror moves once
+returns the bus error count
+"""
+def write_fsm(fpgabus, values):
+    addr = []
+    data = []
+    for idx, (target_chan, value) in enumerate(values):
+        if idx == len(values)-1: command = DAC_WRITE_UPDATE_ALL
+        else:                    command = DAC_WRITE
+        command |= (target_chan%4 & 0b11) << 16 | value
+        addr += [mmap.FSMa, mmap.FSMb, mmap.FSMc]
+        data += [(command & 0x3F0000) >> 16, (command & 0x00FF00) >> 8, (command & 0x0000FF)]
+    errors, values_out = fpgabus.transfer(addr, [1]*len(addr), data)
+    return sum(errors)
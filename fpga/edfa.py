@@ -4,6 +4,9 @@ import options
 import fpga_map as mmap
 import time
 
+# Registers of the EDFA jobs: the UART and the EDFA virtual registers
+REGISTERS = [mmap.ETX, mmap.ERX, mmap.ERF, mmap.EFL, mmap.EDFA_IN_STR, mmap.EDFA_OUT_STR, mmap.EDFA_CMD, mmap.EDFA_AGE] + mmap.EDFA_PARSED_BLOCK
+
 def reset_fifo(fpgabus):
     read_string(fpgabus)
     '''
@@ -17,15 +20,19 @@ def reset_fifo(fpgabus):
 
 def read_string(fpgabus):
     read_max = 1200
-    empty = fpgabus.read_reg(mmap.EFL) & mmap.EFL_EMPTY
     chars = []
-    error = 0
     
+    # An empty FIFO, the usual case of reset_fifo(), costs a single read
+    errors, values = fpgabus.transfer([mmap.EFL], [0], [0])
+    error = sum(errors)
+    empty = values[0] & mmap.EFL_EMPTY
+    
+    # One character per transfer, popped only after EFL said the FIFO was not empty
     while (not empty) and read_max:
-        errors, values = fpgabus.transfer((mmap.ERF,mmap.EFL), (0,0), (0,0))
+        errors, values = fpgabus.transfer((mmap.ERF,mmap.EFL),(0,0),(0,0))
+        error += sum(errors)
         chars.append(chr(values[0]))
         empty = values[1] & mmap.EFL_EMPTY
-        error += sum(errors)
         read_max -= 1
         
     return error,''.join(chars)
@@ -34,17 +41,19 @@ def write_string(fpgabus, tx_str):
     
     start = time.time()
     
+    # The UART takes one character at a time, TX ready is checked before each of them
     for char in tx_str:
         while not (fpgabus.read_reg(mmap.FLG) & mmap.FLG_TX_READY):
             if time.time() > start + options.EDFA_TIMOUT: return True
         fpgabus.write_reg(mmap.ETX, ord(char))
     return False
     
-def fline(fpgabus):
+def fline_request(fpgabus):
     tx_str = 'fline\r'
     reset_fifo(fpgabus)
-    write_string(fpgabus,tx_str)
-    time.sleep(options.EDFA_READ_WRITE_DELAY) 
+    return write_string(fpgabus,tx_str)
+    
+def fline_reply(fpgabus):
     reply = read_string(fpgabus)[1]
     reply = reply.split('\n')
     if len(reply) > 1: 
@@ -52,8 +61,122 @@ def fline(fpgabus):
         return reply
     else:
         return '0 '*len(mmap.EDFA_PARSED_BLOCK)
+    
+def fline(fpgabus):
+    fline_request(fpgabus)
+    time.sleep(options.EDFA_READ_WRITE_DELAY) 
+    return fline_reply(fpgabus)
+    
+def command(fpgabus, req, tx_str, sampler):
+    '''Job sending one command to the EDFA.
+    Answers req with the reply line as soon as it is complete, i.e. after the echo line.'''
+    sampler.hold(req)
+    reset_fifo(fpgabus)
+    error = int(write_string(fpgabus, tx_str))
+    start = time.time()
+    reply = ''
+    lines = []
+    while not error:
+        yield options.EDFA_POLL_PD
+        error, chars = read_string(fpgabus)
+        reply += chars
+        lines = reply.split('\n')
+        if len(lines) > 2: break
+        if time.time() - start > options.EDFA_TIMOUT: error = 1
+    sampler.release(req)
+    
+    if len(lines) > 1: req.answer(lines[1].rstrip('\r'),error)
+    else:              req.answer(reply,error)
+    
+def send_string(fpgabus, req, tx_str, sampler):
+    '''Job of an EDFA_IN_STR write: sends tx_str, the client then reads the reply with EDFA_OUT_STR.
+    The sampler stays off the UART for the client until then.'''
+    sampler.hold(req.return_addr)
+    reset_fifo(fpgabus)
+    error = int(write_string(fpgabus, tx_str))
+    yield 0
+    req.answer('',error)
+    
+def receive_string(fpgabus, req, sampler):
+    '''Job of an EDFA_OUT_STR read: answers req with everything the EDFA sent since EDFA_IN_STR'''
+    error, rx_str = read_string(fpgabus)
+    sampler.release(req.return_addr)
+    yield 0
+    req.answer(rx_str,error)
+    
+class Sampler:
+    '''Refreshes the parsed EDFA registers while the server is idle.
+    The fline exchange is split around EDFA_READ_WRITE_DELAY so the server never sleeps on the UART.
+    Its steps only use the bus after EDFA_SAMPLE_IDLE without requests, or once the snapshot is EDFA_SAMPLE_MAX_AGE old'''
+    
+    IDLE = 0
+    WAIT_REPLY = 1
+    
+    def __init__(self, fpgabus, regs):
+        self.fpgabus = fpgabus
+        self.regs = regs
+        self.state = Sampler.IDLE
+        self.sent_at = 0
+        self.last_update = 0
+        self.holders = {}
+        
+    def tick(self, idle):
+        '''Advance the fline exchange by one step if it is due
+        idle: seconds since the server last had a request to serve'''
+        now = time.time()
+        if self.held(now): return
+        if idle < options.EDFA_SAMPLE_IDLE and now - self.last_update < options.EDFA_SAMPLE_MAX_AGE: return
+        
+        if self.state == Sampler.IDLE:
+            if now - self.last_update >= options.EDFA_SAMPLE_PD:
+                fline_request(self.fpgabus)
+                self.sent_at = now
+                self.state = Sampler.WAIT_REPLY
+                
+        elif now - self.sent_at >= options.EDFA_READ_WRITE_DELAY:
+            # A garbled or partly received reply keeps the last good snapshot, the next tick asks again
+            self.state = Sampler.IDLE
+            try: parse(self.regs, fline_reply(self.fpgabus).split())
+            except ValueError: return
+            self.last_update = self.sent_at
+            
+    def refresh(self):
+        '''Blocking sample, used when no snapshot exists yet'''
+        self.state = Sampler.IDLE
+        try: parse(self.regs, fline(self.fpgabus).split())
+        except ValueError:
+            if self.last_update: return
+            # No snapshot yet: the same registers as when the EDFA does not answer
+            parse(self.regs, ('0 '*len(mmap.EDFA_PARSED_BLOCK)).split())
+        self.last_update = time.time()
+        
+    def hold(self, owner):
+        '''owner is talking to the EDFA: drop the exchange in flight and stay off the UART
+        until owner releases it, or for EDFA_TIMOUT if it never does. Calling it again extends the hold'''
+        self.state = Sampler.IDLE
+        self.holders[owner] = time.time() + options.EDFA_TIMOUT
+        
+    def release(self, owner):
+        '''End the hold of owner, the others keep theirs'''
+        self.holders.pop(owner, None)
+        
+    def held(self, now):
+        for owner, until in self.holders.items():
+            if until <= now: del self.holders[owner]
+        return bool(self.holders)
+        
+    def update_regs(self, regs):
+        '''Make sure a snapshot exists and report its age'''
+        if not self.last_update: self.refresh()
+        regs[mmap.EDFA_AGE] = time.time() - self.last_update
+        return regs
         
 def parse(regs,flist):
+    '''Fill the parsed EDFA registers from the fields of an fline reply
+    raises ValueError, leaving regs untouched, if the reply has too few fields'''
+    if len(flist) < len(mmap.EDFA_PARSED_BLOCK):
+        raise ValueError('Malformed EDFA fline reply: %r' % ' '.join(flist))
+    
     if   flist[0] == 'EL': regs[mmap.EDFA_EN_PIN] = 0
     elif flist[0] == 'HL': regs[mmap.EDFA_EN_PIN] = 1
     else:                  regs[mmap.EDFA_EN_PIN] = 2
@@ -8,16 +8,38 @@ import ipc_helper
 import fpga_map as mmap
 import fpga_bus
 import edfa
+import planner
 import dac
+import shadow
+import telemetry
+import scheduler
+import sensor_lut
+import reg_codec
+import ipc_packets
+import streams
+import modulator
+import jobs
+import macro
+import condition
+import align
+import scope
+import oversample
 import time
 
 def loop():
 
     #ZMQ i/f. Keep timout low to update ZMQ internal logic before clients time-out.
     ipc_server = ipc_helper.FPGAServerInterface(timeout=100)
+    
+    # Requests are served by priority class, not arrival order
+    sched = scheduler.Scheduler(ipc_server)
+    
+    # Requests answered later, without blocking the loop
+    runner = jobs.JobRunner(sched)
 
     #FPGA i/f
-    if options.IPC_USES_SPI: fpgabus = fpga_bus.SPIBus()
+    if options.IPC_USES_SIM: fpgabus = fpga_bus.SimBus()
+    elif options.IPC_USES_SPI: fpgabus = fpga_bus.SPIBus()
     else: fpgabus = fpga_bus.USBBus()
     
     # Check if the FPGA is alive
@@ -25,20 +47,103 @@ def loop():
     
     # Buffer for virtual regs
     reg_buffer = {}
-    last_edfa_update = 0
+    
+    # Write-through copy of the config registers
+    cache = shadow.ShadowCache()
+    
+    # Errors are sent to the bus like the other processes do
+    tx_socket = zmq.Context().socket(zmq.PUB)
+    tx_socket.connect("tcp://127.0.0.1:%s" % options.TX_PACKETS_PORT)
+
+    # Temperature and current conversion tables, rebuilt when the calibration file changes
+    lut = sensor_lut.SensorLUT(tx_socket=tx_socket)
+    
+    # EDFA status is sampled in the background, reads are served from the snapshot
+    sampler = edfa.Sampler(fpgabus, reg_buffer)
+    
+    # FPGA_TELEM is assembled in the background, reads get the latest snapshot
+    telem = telemetry.Snapshot(fpgabus, reg_buffer, cache, sampler, lut)
+
+    def refresh_buffers(plan):
+        '''Update the buffered virtual registers the plan reads'''
+        if plan.edfa_needed: sampler.update_regs(reg_buffer)
+        if plan.telemetry_time: telem.update_regs(reg_buffer)
+
+        if plan.diagnostics:
+            fpgabus.stats.update_regs(reg_buffer)
+            cache.update_regs(reg_buffer)
+            sched.update_regs(reg_buffer)
+            
+    def plan_reads(addresses):
+        plan = planner.plan_request(addresses, 0, [0]*len(addresses), reg_buffer, cache, lut)
+        refresh_buffers(plan)
+        return plan
+        
+    def access(addresses, rw_flag, values, uncached=False):
+        '''Plan and run one request on behalf of a job, returns (error count, values)
+        uncached: reads bypass the shadow cache, for readbacks of the hardware'''
+        plan = planner.plan_request(addresses, rw_flag, values, reg_buffer, cache, lut, uncached)
+        if plan.error: return 1, []
+        refresh_buffers(plan)
+        return plan.run(fpgabus)
+        
+    # Register streams, sampled once per period for all their subscribers
+    publisher = streams.Publisher(ipc_server, fpgabus, plan_reads)
 
     while 1:
     
-        try:
-            req = ipc_server.get_request()
-        except zmq.ZMQError as e:
-            if e.errno == zmq.EAGAIN: continue
+        sampler.tick(sched.idle(time.time()))
+        telem.tick()
+        runner.tick()
+        publisher.tick()
+        lut.tick()
+        
+        sched.drain(min(runner.timeout(100), publisher.timeout(100)))
+        req = sched.next_request()
+        if req is None: continue
             
-        # EDFA in and out string have a special packet, containing a string for a single address
-        if req.start_addr == mmap.EDFA_IN_STR:
+        # FSM pointing, latest wins: the setpoints queued behind this one are merged in,
+        # all the channels are written in one transfer, updated together, and every request is answered
+        setpoint = scheduler.fsm_setpoint(req)
+        reads = scheduler.read_addresses(req) if options.MERGE_READS else None
+        if setpoint is not None:
+            updates = [(req, setpoint)] + sched.take_fsm_updates()
+            merged = {}
+            for fsm_req, fsm_setpoint in updates: merged.update(fsm_setpoint)
+            error_flag = dac.write_fsm(fpgabus, [(addr - mmap.DAC_BLOCK[0], merged[addr]) for addr in sorted(merged)])
+            for fsm_req, fsm_setpoint in updates:
+                fsm_req.answer([value for addr, value in fsm_setpoint], error_flag)
+            continue
+            
+        # Plain reads, the reads queued meanwhile are merged in:
+        # every register asked is read once, in one transfer, and every request is answered from it
+        elif reads is not None:
+            merged_reads = [(req, reads)] + sched.take_reads(reads)
+            addresses = sorted(set([addr for read_req, read_addresses in merged_reads for addr in read_addresses]))
+            plan = planner.plan_request(addresses, 0, [0]*len(addresses), reg_buffer, cache, lut)
+            if plan.error:
+                for read_req, read_addresses in merged_reads: read_req.answer('',error_flag=1)
+                continue
+            refresh_buffers(plan)
+            error_flag,values_out = plan.run(fpgabus)
+            values = dict(zip(addresses, values_out))
+            for read_req, read_addresses in merged_reads:
+                read_req.answer([values[addr] for addr in read_addresses], error_flag)
+            continue
+            
+        # Scatter-gather requests only go through the planner
+        elif req.addresses is not None:
         
-            edfa.reset_fifo(fpgabus)
+            # Strings have their own packets, and FPGA_TELEM answers several values: clients list its registers instead
+            if mmap.FPGA_TELEM in req.addresses or 'str' in [mmap.REGISTER_TYPE[addr] for addr in req.addresses]:
+                req.answer('',error_flag=1)
+                continue
+            addresses = req.addresses
             
+        # EDFA in and out string have a special packet, containing a string for a single address
+        # They share the UART with the EDFA_CMD and SEED_ALIGN jobs, so they run as jobs on the same resource
+        elif req.start_addr == mmap.EDFA_IN_STR:
+        
             if options.CHECK_ASSERTS: assert req.size > 3
             
             len_str = struct.unpack('I', req.write_data[0:4])[0] 
@@ -46,129 +151,101 @@ def loop():
             if options.CHECK_ASSERTS: assert req.size >= (len_str+4)
             
             values_in = req.write_data[4:4+len_str]
-            error_flag = edfa.write_string(fpgabus, values_in)
-            req.answer('',error_flag)
+            runner.submit(req, edfa.send_string(fpgabus, req, values_in, sampler), resource=mmap.EDFA_CMD, registers=edfa.REGISTERS)
             continue
             
         elif req.start_addr == mmap.EDFA_OUT_STR:
             
-            error,edfa_out_str = edfa.read_string(fpgabus)
-            req.answer(edfa_out_str,error)
+            runner.submit(req, edfa.receive_string(fpgabus, req, sampler), resource=mmap.EDFA_CMD, registers=edfa.REGISTERS)
             continue
             
-        # Decoding the incoming packet
-        register_number = req.size//4
-        addresses = range(req.start_addr, req.start_addr+register_number)
-        if req.rw_flag and register_number:
-            values_in = []
-            for addr,idx in zip(addresses,xrange(0,req.size,4)):
-                frmt = mmap.REGISTER_TYPE[addr]
-                pl = req.write_data[idx:idx+4]
-                decode = struct.unpack(frmt,pl)
-                if len(decode): values_in.append(decode[0])
-                else: values_in.append(0)
-        else:
-            values_in = [0]*register_number
+        elif req.start_addr == mmap.EDFA_CMD and req.rw_flag:
+        
+            if options.CHECK_ASSERTS: assert req.size > 3
+            
+            tx_str = reg_codec.decode_str(req.write_data)
+            runner.submit(req, edfa.command(fpgabus, req, tx_str, sampler), resource=mmap.EDFA_CMD, registers=edfa.REGISTERS)
+            continue
+            
+        elif req.start_addr == mmap.MOD_FIFO and req.rw_flag:
+        
+            symbols = [ord(symbol) for symbol in reg_codec.decode_str(req.write_data)]
+            runner.submit(req, modulator.stream(fpgabus, req, symbols), resource=mmap.MOD_FIFO, registers=modulator.REGISTERS)
+            continue
+            
+        elif req.start_addr == mmap.STREAM_SUBSCRIBE and req.rw_flag:
+        
+            subscription = ipc_packets.FPGAStreamSubscribePacket()
+            period_ms, stream_addresses = subscription.decode(reg_codec.decode_str(req.write_data))
+            stream_id = publisher.subscribe(req.return_addr, period_ms, stream_addresses)
+            if stream_id is None: req.answer('',error_flag=1)
+            else: req.answer(struct.pack('I',stream_id))
+            continue
+            
+        elif req.start_addr == mmap.STREAM_UNSUBSCRIBE and req.rw_flag:
+        
+            publisher.unsubscribe(req.return_addr, reg_codec.codec(req.start_addr,1).decode(req.write_data)[0])
+            req.answer('')
+            continue
+            
+        elif req.start_addr == mmap.MACRO and req.rw_flag:
+        
+            operations = ipc_packets.FPGAMacroPacket().decode(reg_codec.decode_str(req.write_data))
+            runner.submit(req, macro.run(req, operations, access), resource=mmap.MACRO, registers=macro.registers(operations))
+            continue
+            
+        elif req.start_addr == mmap.WAIT_COND and req.rw_flag:
         
-        if req.start_addr < 128:
-            # Raw registers
-            write_flag = [req.rw_flag]*register_number 
-            errors,values_out = fpgabus.transfer(addresses, write_flag, values_in)
+            addr, mask, value, period_us, timeout_ms = ipc_packets.FPGAWaitPacket().decode(reg_codec.decode_str(req.write_data))
+            runner.submit(req, condition.wait(req, addr, mask, value, period_us/1e6, timeout_ms/1000.0, access), registers=[mmap.WAIT_COND, addr])
+            continue
+            
+        elif req.start_addr == mmap.SEED_ALIGN and req.rw_flag:
+        
+            center, window, band_low, band_high = ipc_packets.FPGAAlignPacket().decode(reg_codec.decode_str(req.write_data))
+            steps = align.scan(req, fpgabus, sampler, access, center, window, band_low, band_high)
+            runner.submit(req, steps, resource=mmap.EDFA_CMD, registers=align.REGISTERS)
+            continue
             
-            error_flag = sum(errors)
-            req.answer(values_out,error_flag)
+        elif req.start_addr == mmap.BIST_SWEEP and req.rw_flag:
+        
+            start, stop, step, repeats = ipc_packets.FPGABistSweepPacket().decode(reg_codec.decode_str(req.write_data))
+            runner.submit(req, scope.sweep(req, access, start, stop, step, repeats), resource=mmap.BIST_SWEEP, registers=scope.REGISTERS)
+            continue
+            
+        elif req.start_addr == mmap.FPGA_TELEM and not req.rw_flag:
+        
+            req.answer_raw(telem.get_raw())
+            continue
             
         else:
-            # Virtual registers
-            
-            # ----------------- EDFA -----------------
-            # if any in the EDFA block, get FLINE
-            if any([x in mmap.EDFA_PARSED_BLOCK for x in addresses]):
-                if time.time() - last_edfa_update > options.EDFA_VIRTUAL_REGS_GOOD_FOR:
-                    fline = edfa.fline(fpgabus)
-                    flist = fline.split()
-                    reg_buffer = edfa.parse(reg_buffer, flist)
-
-            # -----------------------------------------
-            
-            values_out = []
-            for addr,value in zip(addresses,values_in):
-            
-                if addr in mmap.TEMPERATURE_BLOCK:
-                    msb = fpgabus.read_reg(mmap.BYTE_1[addr])
-                    lsb = fpgabus.read_reg(mmap.BYTE_2[addr])
-                    temp = mmap.decode_temperature(msb,lsb)
-                    values_out.append(temp)
-                
-                #converts adc value to current in amps
-                elif addr in mmap.CURRENT_BLOCK:
-                    msb = fpgabus.read_reg(mmap.BYTE_3[addr])
-                    lsb = fpgabus.read_reg(mmap.BYTE_4[addr])
-                    temp = mmap.decode_current(msb,lsb)
-                    values_out.append(temp)
-                    
-                # ----------------- EDFA -----------------
-                elif addr in mmap.EDFA_PARSED_BLOCK:
-                    values_out.append(reg_buffer[addr])
-                    
-                    
-                # ----------------- DACs ----------------- 
-                elif addr == mmap.DAC_SETUP:
-                    dac.init(fpgabus, value)
-
-                elif addr == mmap.DAC_ENABLE:
-                    dac.set_output_mode(fpgabus, value)
-                    
-                elif addr == mmap.DAC_RESET:
-                    is_por = (value & 0b0100) >> 2
-                    ref_en = (value & 0b1000) >> 3
-                    if value & 0b01:
-                        dac.reset(fpgabus, 1, is_por)
-                        dac.set_reference(fpgabus, 1, is_por)
-                    if value & 0b10: dac.reset(fpgabus, 2, ref_en)
-               
-                elif addr in mmap.DAC_BLOCK:
-                    if req.rw_flag:
-                        target_chan = addr - mmap.DAC_BLOCK[0]
-                        dac.write_and_update(fpgabus,target_chan,value)
-                    values_out.append(value)
-                # ----------Telemetry---------------------- 
-
-                elif addr == mmap.FPGA_TELEM:
-                    fline = edfa.fline(fpgabus)
-                    flist = fline.split()
-                    reg_buffer = edfa.parse(reg_buffer, flist)
-                    time.sleep(.5)
-                    addresses = options.FPGA_TELEM_REGS
-                    values_out = []
-                    for addr in addresses:
-                        if addr in mmap.TEMPERATURE_BLOCK:
-                            msb = fpgabus.read_reg(mmap.BYTE_1[addr])
-                            lsb = fpgabus.read_reg(mmap.BYTE_2[addr])
-                            temp = mmap.decode_temperature(msb,lsb)
-                            values_out.append(temp)
-
-                        elif addr in mmap.CURRENT_BLOCK:
-                            msb = fpgabus.read_reg(mmap.BYTE_3[addr])
-                            lsb = fpgabus.read_reg(mmap.BYTE_4[addr])
-                            temp = mmap.decode_current(msb,lsb)
-                            values_out.append(temp)
-
-                        elif addr in mmap.DAC_BLOCK:
-                            if req.rw_flag:
-                                target_chan = addr - mmap.DAC_BLOCK[0]
-                                dac.write_and_update(fpgabus,target_chan,value)
-                            values_out.append(value)
-
-                        elif addr not in mmap.EDFA_PARSED_BLOCK:
-                            values_out.append(fpgabus.transfer([addr], [req.rw_flag], [0])[1][0])
-
-                        else:
-                            values_out.append(reg_buffer[addr])
+            addresses = range(req.start_addr, req.start_addr+req.size//4)
+            
+        # Oversampled reads: the registers are read samples times, one transfer each, only their statistics are answered
+        if req.samples is not None:
+            if req.rw_flag or not 0 < req.samples <= options.OVERSAMPLE_MAX:
+                req.answer('',error_flag=1)
+                continue
+            runner.submit(req, oversample.sample(req, addresses, req.samples, access))
+            continue
+            
+        # Decoding the incoming packet
+        if req.rw_flag and addresses:
+            if req.addresses is not None: block = reg_codec.list_codec(addresses)
+            else:                         block = reg_codec.codec(req.start_addr, len(addresses))
+            values_in = block.decode(req.write_data)
+        else:
+            values_in = [0]*len(addresses)
+        
+        plan = planner.plan_request(addresses, req.rw_flag, values_in, reg_buffer, cache, lut, bool(req.uncached))
+        if plan.error:
+            req.answer('',error_flag=1)
+            continue
 
-                else: req.answer('',error_flag=1)
+        refresh_buffers(plan)
 
-                
-            req.answer(values_out)
+        # All bus accesses of the request go out in a single transfer
+        error_flag,values_out = plan.run(fpgabus)
+        req.answer(values_out,error_flag)
         
 loop()
\ No newline at end of file
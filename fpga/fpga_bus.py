@@ -1,11 +1,33 @@
 #!/usr/bin/env python
 import sys
 import itertools
+import collections
+import random
+import time
 sys.path.append('/root/lib/')
 import options
+import fpga_map as mmap
+
+class TransferStats:
+    def __init__(self):
+        self.transfers = 0
+        self.bytes = 0
+        self.addr_errors = 0
+        self.time = 0.0
+        self.reopens = 0
+
+    def update_regs(self, regs):
+        '''Copy the counters in a virtual register buffer'''
+        regs[mmap.SPI_TRANSFERS]   = self.transfers
+        regs[mmap.SPI_BYTES]       = self.bytes
+        regs[mmap.SPI_ADDR_ERRORS] = self.addr_errors
+        regs[mmap.SPI_TIME]        = self.time
+        regs[mmap.SPI_REOPENS]     = self.reopens
+        return regs
 
 class FPGABusBase:
-    def __init__(self): pass
+    def __init__(self):
+        self.stats = TransferStats()
     
     def read_reg(self, addr):
         return self.transfer( (addr,), (0,), (0,) )[1][0]
@@ -19,6 +41,31 @@ class SPIBus(FPGABusBase):
         import spidev
         
         self.spi = spidev.SpiDev()
+        self.is_open = False
+        
+        # Registers per xfer, each chunk carries 2 bytes per register plus 2 trailing bytes
+        self.chunk_size = (options.SPI_MAX_XFER - 2)//2
+        
+    def _open(self):
+        if not self.is_open:
+            self.spi.open(1, 0)
+            self.is_open = True
+            
+    def _close(self):
+        try: self.spi.close()
+        except (IOError, OSError): pass
+        self.is_open = False
+        
+    def _xfer(self, data_in):
+        # The device stays open between transfers, reopen it once if it failed
+        try:
+            self._open()
+            return self.spi.xfer(data_in, options.SPI_FREQ)
+        except (IOError, OSError):
+            self._close()
+            self.stats.reopens += 1
+            self._open()
+            return self.spi.xfer(data_in, options.SPI_FREQ)
            
     def transfer(self, addr_in, is_write, values):
     
@@ -27,15 +74,24 @@ class SPIBus(FPGABusBase):
         def enc(addr, w_f, val): return (addr & 0x7F) | ((w_f & 1) << 7), (val & 0xFF)
         data_in = list(itertools.chain.from_iterable([enc(addr, w_f, val) for addr, w_f, val in iter_input]))
         
-        # Run transfer
-        self.spi.open(1, 0)
-        data_out = self.spi.xfer(data_in+[0,0], options.SPI_FREQ)
-        self.spi.close()
-        
-        # Check return addresses
-        errors = [ain != aout for ain, aout in zip(data_in[0::2], data_out[2::2])]
+        # Run transfer, split in chunks that fit the spidev buffer
+        start = time.time()
+        errors = []
+        values_out = []
+        for idx in xrange(0, len(data_in), 2*self.chunk_size):
+            chunk = data_in[idx:idx+2*self.chunk_size]
+            data_out = self._xfer(chunk+[0,0])
+            
+            # Check return addresses
+            errors += [ain != aout for ain, aout in zip(chunk[0::2], data_out[2::2])]
+            values_out += data_out[3::2]
+            
+            self.stats.transfers += 1
+            self.stats.bytes += len(chunk)+2
+            
+        self.stats.addr_errors += sum(errors)
+        self.stats.time += time.time() - start
         
-        values_out = data_out[3::2]
         return errors,values_out
         
     def verify_boot(self):
@@ -48,6 +104,121 @@ class SPIBus(FPGABusBase):
         if addr_error == 0 and dcm_locked == 1 and crc_err == 0: return True
         else: return False
         
+class SimBus(SPIBus):
+    '''Behavioral model of the FPGA, to run the server and its clients without flight hardware.
+    Bytes go through the SPI protocol encoding, addresses are echoed one register late like the real device.
+    Models the register file, the EDFA UART with canned replies, the ADC channels, the DAC command
+    triples, the BIST capture and the modulator FIFO. Every transfer costs SIM_LATENCY plus the SPI clock time.'''
+
+    EDFA_REPLIES = {'fline': 'HL ACC LDON 25.1 -2.5 17.3 120 30 2200 31.5'}
+    TEMPERATURE_CODE = 1800 # about 20 C
+    CURRENT_CODE = 250      # about 0.2 A
+    CAPTURE_TIME = 0.01     # seconds per BIST capture
+    CAPTURE_TOTAL = 10000   # BIST total count per capture
+
+    def __init__(self, latency=None):
+        FPGABusBase.__init__(self)
+        self.chunk_size = (options.SPI_MAX_XFER - 2)//2
+        if latency is None: latency = options.SIM_LATENCY
+        self.latency = latency
+
+        self.regs = [0]*128
+        self.regs[mmap.FLG] = mmap.FLG_DCM_LOCKED | mmap.FLG_TX_READY
+
+        # EDFA UART
+        self.edfa_line = ''
+        self.edfa_rx = collections.deque()
+
+        # ADC channels, by register of their MSB and LSB
+        self.adc = {}
+        for reg in mmap.TEMPERATURE_BLOCK: self.adc[mmap.BYTE_1[reg]] = self.adc[mmap.BYTE_2[reg]] = self.TEMPERATURE_CODE
+        for reg in mmap.CURRENT_BLOCK:     self.adc[mmap.BYTE_3[reg]] = self.adc[mmap.BYTE_4[reg]] = self.CURRENT_CODE
+        self.adc_msb = set([mmap.BYTE_1[reg] for reg in mmap.TEMPERATURE_BLOCK] + [mmap.BYTE_3[reg] for reg in mmap.CURRENT_BLOCK])
+        self.codes = {}
+
+        # DAC outputs, 0-3 photodiode board DAC, 4-7 FSM DAC
+        self.dac = [0]*8
+
+        self.capture_start = None
+        self.mod_fill = 0
+        self.mod_time = time.time()
+
+    def _xfer(self, data_in):
+        time.sleep(self.latency + 8.0*len(data_in)/options.SPI_FREQ)
+        self._drain_modulator()
+
+        # One noisy conversion per ADC channel and transfer, so MSB and LSB agree
+        self.codes = {}
+
+        data_out = [0, 0]
+        for cmd, val in zip(data_in[0::2], data_in[1::2])[:-1]:
+            data_out += [cmd, self._access(cmd & 0x7F, cmd >> 7, val)]
+        return data_out
+
+    def _access(self, addr, w_f, val):
+        if w_f:
+            self.regs[addr] = val
+            if   addr == mmap.ETX: self._edfa_char(chr(val))
+            elif addr == mmap.THRc: self._dac_command(0, mmap.THRa)
+            elif addr == mmap.FSMc: self._dac_command(4, mmap.FSMa)
+            elif addr == mmap.DATA: self.mod_fill = min(self.mod_fill+1, options.MOD_FIFO_DEPTH)
+            elif addr == mmap.SCN and val & mmap.SCN_RUN_CAPTURE: self._capture()
+            return val
+
+        if addr == mmap.EFL:
+            if self.edfa_rx: return 0
+            else: return mmap.EFL_EMPTY
+        if addr == mmap.ERF:
+            if self.edfa_rx: return ord(self.edfa_rx.popleft())
+            else: return 0
+        if addr == mmap.SCF:
+            flags = mmap.SCF_PLL_LOCKED | mmap.SCF_PLL_RECONF_RDY
+            if self.capture_start is not None and time.time() - self.capture_start > self.CAPTURE_TIME:
+                flags |= mmap.SCF_CAPTURE_DONE
+            return flags
+        if addr == mmap.DFPa: return self.mod_fill // 256
+        if addr == mmap.DFPb: return self.mod_fill % 256
+        if addr in self.adc:
+            # LSB register follows the MSB one
+            if addr in self.adc_msb: msb = addr
+            else:                    msb = addr - 1
+            if msb not in self.codes: self.codes[msb] = self.adc[addr] + random.randint(-4, 4)
+            if addr == msb: return self.codes[msb] // 256
+            else:           return self.codes[msb] % 256
+        return self.regs[addr]
+
+    def _edfa_char(self, char):
+        # The EDFA echoes the command line, then answers with one line
+        self.edfa_line += char
+        if char != '\r': return
+        command = self.edfa_line.strip()
+        self.edfa_line = ''
+        reply = self.EDFA_REPLIES.get(command, 'OK')
+        self.edfa_rx.extend(command + '\r\n' + reply + '\r\n')
+
+    def _dac_command(self, first_chan, first_reg):
+        command = (self.regs[first_reg] & 0x3F) << 16 | self.regs[first_reg+1] << 8 | self.regs[first_reg+2]
+        if command & (0b111 << 19) == (0b011 << 19):
+            # Write and update one channel
+            self.dac[first_chan + ((command >> 16) & 0b11)] = command & 0xFFFF
+
+    def _capture(self):
+        # Counts above the BIST thresholds, DAC_1 A-C, fall linearly with the threshold
+        self.capture_start = time.time()
+        counts = [self.CAPTURE_TOTAL] + [self.CAPTURE_TOTAL*(0xFFFF - th)//0xFFFF for th in self.dac[0:3]]
+        for reg, count in zip([mmap.SCTa, mmap.SCAa, mmap.SCBa, mmap.SCCa], counts):
+            self.regs[reg] = count % 256
+            self.regs[reg+1] = count // 256
+
+    def _drain_modulator(self):
+        now = time.time()
+        if not self.regs[mmap.CTL] & mmap.CTL_STALL:
+            self.mod_fill = max(0, self.mod_fill - int((now - self.mod_time)*options.SIM_SYMBOL_RATE))
+        self.mod_time = now
+
+    def _open(self): pass
+    def _close(self): pass
+
 class USBBus(FPGABusBase):
     def __init__(self):
         FPGABusBase.__init__(self)
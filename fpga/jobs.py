@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import time
+
+class Job:
+    def __init__(self, req, steps, resource):
+        self.req = req
+        self.steps = steps
+        self.resource = resource
+        self.wake = 0
+
+class JobRunner:
+    '''Runs the requests whose answer is deferred, without blocking the server loop.
+    A job is a generator: each step talks to the bus and yields the seconds to wait
+    before the next one. The generator answers its own request when done.
+    Jobs sharing a resource (e.g. the EDFA UART) run one at a time, in submission order.
+    While a job runs, the later requests of its client touching the registers of the job wait.'''
+    def __init__(self, sched):
+        self.sched = sched
+        self.jobs = []
+
+    def submit(self, req, steps, resource=None, registers=None):
+        # Later requests of the same client touching registers wait for this answer, all of them if registers is None
+        self.sched.hold(req, registers)
+        self.jobs.append(Job(req, steps, resource))
+
+    def tick(self):
+        '''Run every job step that is due'''
+        now = time.time()
+        busy = set()
+        for job in list(self.jobs):
+            if job.resource is not None:
+                if job.resource in busy: continue
+                busy.add(job.resource)
+            if job.wake > now: continue
+            try:
+                job.wake = now + next(job.steps)
+            except StopIteration:
+                self._finish(job)
+            except Exception:
+                job.req.answer('',error_flag=1)
+                self._finish(job)
+
+    def _finish(self, job):
+        self.jobs.remove(job)
+        self.sched.release(job.req)
+
+    def timeout(self, default):
+        '''ms the server can wait for requests before the next job step is due.
+        Jobs waiting for a busy resource are not due, the same way tick() skips them'''
+        busy = set()
+        wakes = []
+        for job in self.jobs:
+            if job.resource is not None:
+                if job.resource in busy: continue
+                busy.add(job.resource)
+            wakes.append(job.wake)
+        if not wakes: return default
+        wait = min(wakes) - time.time()
+        return max(0, min(default, int(1000*wait)))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import options
+import fpga_map as mmap
+import ipc_packets
+import reg_codec
+from ipc_packets import MACRO_READ, MACRO_WRITE, MACRO_SET, MACRO_CLEAR, MACRO_MASK, MACRO_VERIFY, \
+    MACRO_BRANCH_EQ, MACRO_BRANCH_NE, MACRO_WAIT, MACRO_LOOP
+
+def _matches(value, mask, operand):
+    return (int(value) & mask) == (operand & mask)
+
+def registers(operations):
+    '''returns the registers a macro touches'''
+    return [mmap.MACRO] + [addr for opcode, addr, operand in operations
+        if opcode in (MACRO_READ, MACRO_WRITE, MACRO_SET, MACRO_CLEAR, MACRO_VERIFY)]
+
+def run(req, operations, access):
+    '''Job executing a register macro, answers req with an FPGAMacroResultPacket of the captured values.
+    access(addresses, rw_flag, values) runs one planned request and returns (error count, values),
+    so macro reads and writes see the virtual registers and keep the shadow cache coherent.
+    Macro reads and verifies are readbacks of the hardware: they never come from the shadow cache.
+    Everything between two waits runs without any other request in between.
+    The macro fails, with the error flag, on a bus error, a failed verify, or after MACRO_MAX_STEPS operations.'''
+    captured = []
+    value = 0
+    mask = 0xFFFFFFFF
+    loops = {}
+    error = 0
+    steps = 0
+    idx = 0
+    while idx < len(operations) and not error:
+        opcode, addr, operand = operations[idx]
+        idx += 1
+        steps += 1
+        if steps > options.MACRO_MAX_STEPS:
+            error = 1
+
+        elif opcode in (MACRO_READ, MACRO_VERIFY):
+            error, values = access([addr], 0, [0], True)
+            if error: break
+            value = values[0]
+            captured.append((addr, value))
+            if opcode == MACRO_VERIFY and not _matches(value, mask, operand): error = 1
+
+        elif opcode == MACRO_WRITE:
+            error = access([addr], 1, [operand])[0]
+
+        elif opcode in (MACRO_SET, MACRO_CLEAR):
+            error, values = access([addr], 0, [0])
+            if error: break
+            if opcode == MACRO_SET: value = values[0] | operand
+            else:                   value = values[0] & ~operand & 0xFFFFFFFF
+            error = access([addr], 1, [value])[0]
+
+        elif opcode == MACRO_MASK:
+            mask = operand
+
+        elif opcode == MACRO_BRANCH_EQ:
+            if _matches(value, mask, operand): idx = addr
+
+        elif opcode == MACRO_BRANCH_NE:
+            if not _matches(value, mask, operand): idx = addr
+
+        elif opcode == MACRO_WAIT:
+            yield min(operand/1000.0, options.MACRO_MAX_WAIT)
+
+        elif opcode == MACRO_LOOP:
+            remaining = loops.get(idx, operand) - 1
+            if remaining > 0:
+                loops[idx] = remaining
+                idx = addr
+            else:
+                loops.pop(idx, None)
+
+        else: error = 1
+
+    addresses = [addr for addr, value in captured]
+    read_data = reg_codec.list_codec(addresses).encode([value for addr, value in captured])
+    result = ipc_packets.FPGAMacroResultPacket()
+    req.answer(result.encode(addresses, read_data), error_flag=int(bool(error)))
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import time
+import options
+import fpga_map as mmap
+
+# Registers of the stream job
+REGISTERS = [mmap.MOD_FIFO, mmap.DATA, mmap.DFPa, mmap.DFPb]
+
+def fifo_fill(raw_a, raw_b):
+    return raw_a*256 + raw_b
+
+def stream(fpgabus, req, symbols):
+    '''Job writing a symbol buffer into the modulator FIFO.
+    Each transfer writes as many symbols as the FIFO has room for, up to MOD_FIFO_BURST,
+    and reads DFPa/DFPb back to size the next one. Answers req once every symbol is written.'''
+    sent = 0
+    error = 0
+    errors, values = fpgabus.transfer([mmap.DFPa, mmap.DFPb], [0,0], [0,0])
+    error += sum(errors)
+    fill = fifo_fill(*values)
+    full_since = None
+
+    while sent < len(symbols):
+        room = min(options.MOD_FIFO_DEPTH - fill, options.MOD_FIFO_BURST, len(symbols) - sent)
+        if room <= 0:
+            # FIFO full, e.g. stalled: wait for the modulator to drain it
+            if full_since is None: full_since = time.time()
+            if time.time() - full_since > options.MOD_FIFO_TIMEOUT:
+                error += 1
+                break
+            yield options.MOD_FIFO_POLL_PD
+            errors, values = fpgabus.transfer([mmap.DFPa, mmap.DFPb], [0,0], [0,0])
+            error += sum(errors)
+            fill = fifo_fill(*values)
+            continue
+        full_since = None
+
+        burst = symbols[sent:sent+room]
+        errors, values = fpgabus.transfer([mmap.DATA]*room + [mmap.DFPa, mmap.DFPb], [1]*room + [0,0], burst + [0,0])
+        error += sum(errors)
+        fill = fifo_fill(*values[-2:])
+        sent += room
+        
+        # Let other requests through between bursts
+        if sent < len(symbols): yield 0
+
+    req.answer('',int(error > 0))
@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import math
+import options
+import reg_codec
+
+def statistics(values, count):
+    '''values: readings of count registers, then the same registers again, samples times
+    returns
+    list of (mean, min, max, std), one per register'''
+    stats = []
+    for idx in range(count):
+        samples = [float(value) for value in values[idx::count]]
+        mean = sum(samples)/len(samples)
+        variance = sum([(sample - mean)**2 for sample in samples])/len(samples)
+        stats.append((mean, min(samples), max(samples), math.sqrt(variance)))
+    return stats
+
+def sample(req, addresses, samples, access):
+    '''Job reading addresses samples times, OVERSAMPLE_PD apart.
+    Each reading is its own transfer: the readings of one transfer would share the same ADC conversion.
+    access(addresses, rw_flag, values) runs one planned request and returns (error count, values).
+    Answers req with the (mean, min, max, std) of each register.'''
+    values = []
+    for idx in range(samples):
+        if idx: yield options.OVERSAMPLE_PD
+        error, reading = access(addresses, 0, [0]*len(addresses))
+        if error or len(reading) != len(addresses):
+            req.answer('',error_flag=1)
+            return
+        values += reading
+    req.answer_raw(reg_codec.encode_stats(statistics(values, len(addresses))))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import options
+import fpga_map as mmap
+import fpga_bus
+import dac
+import sensor_lut
+
+class Plan(fpga_bus.FPGABusBase):
+    '''Raw bus accesses needed to serve one request.
+    Behaves like a bus for the dac helpers: their transfers are recorded
+    here instead of being sent, so the whole request runs as one transfer.'''
+    def __init__(self, cache=None, lut=None, uncached=False):
+        fpga_bus.FPGABusBase.__init__(self)
+        self.cache = cache
+        self.uncached = uncached
+        self.lut = lut
+        self.sensors = []
+        self.converted = []
+        self.shadowed = []
+        self.flush_cache = False
+        self.addresses = []
+        self.rw_flags = []
+        self.values = []
+        self.outputs = []
+        self.edfa_needed = False
+        self.telemetry_time = False
+        self.diagnostics = False
+        self.error = 0
+
+    def access(self, addr, rw_flag=0, value=0):
+        '''Queue one raw access, returns its index in the transfer results'''
+        self.addresses.append(addr)
+        self.rw_flags.append(rw_flag)
+        self.values.append(value)
+        return len(self.addresses) - 1
+
+    def output(self, decode):
+        '''decode: function of the raw transfer results giving one answer value'''
+        self.outputs.append(decode)
+
+    def sensor(self, addr, msb, lsb):
+        '''Answer value of a temperature or current channel, from its MSB and LSB access indexes.
+        All the channels of the plan are converted in one call when it runs'''
+        self.sensors.append((addr, msb, lsb))
+        idx = len(self.sensors) - 1
+        self.output(lambda raw: self.converted[idx])
+
+    def transfer(self, addr_in, is_write, values):
+        for addr, w_f, val in zip(addr_in, is_write, values):
+            self.access(addr, w_f, val)
+        return [0]*len(addr_in), [0]*len(addr_in)
+
+    def run(self, fpgabus):
+        '''Execute all the accesses in a single transfer and map the results back
+        returns
+        error count, list of answer values'''
+        if self.addresses:
+            errors, raw = fpgabus.transfer(self.addresses, self.rw_flags, self.values)
+        else:
+            errors, raw = [], []
+
+        # Write-through: keep what was written, or what was read on a miss
+        if self.flush_cache: self.cache.flush()
+        for addr, idx, written in self.shadowed:
+            if errors[idx]: continue
+            if written is None: self.cache.store(addr, raw[idx])
+            else:               self.cache.store(addr, written)
+
+        if self.sensors:
+            lut = self.lut or sensor_lut.default()
+            addresses, msbs, lsbs = zip(*self.sensors)
+            self.converted = lut.convert_vector(addresses, [raw[idx] for idx in msbs], [raw[idx] for idx in lsbs])
+
+        return sum(errors), [decode(raw) for decode in self.outputs]
+
+def _plan_register(plan, addr, rw_flag, value, reg_buffer):
+
+    if addr < 128:
+        # Raw registers, reads of config registers are served by the shadow cache unless the plan is a hardware readback
+        if plan.cache and not rw_flag and not plan.uncached:
+            cached = plan.cache.lookup(addr)
+            if cached is not None:
+                plan.output(lambda raw: cached)
+                return
+        idx = plan.access(addr, rw_flag, value)
+        plan.output(lambda raw: raw[idx])
+        if plan.cache and mmap.REGISTER_CLASS[addr] != mmap.REG_VOLATILE:
+            if rw_flag: plan.shadowed.append((addr, idx, value))
+            else:       plan.shadowed.append((addr, idx, None))
+
+    elif addr in mmap.TEMPERATURE_BLOCK:
+        plan.sensor(addr, plan.access(mmap.BYTE_1[addr]), plan.access(mmap.BYTE_2[addr]))
+
+    #converts adc value to current in amps
+    elif addr in mmap.CURRENT_BLOCK:
+        plan.sensor(addr, plan.access(mmap.BYTE_3[addr]), plan.access(mmap.BYTE_4[addr]))
+
+    # ----------------- EDFA -----------------
+    elif addr in mmap.EDFA_PARSED_BLOCK or addr == mmap.EDFA_AGE:
+        plan.edfa_needed = True
+        plan.output(lambda raw: reg_buffer[addr])
+
+    # ----------------- DACs -----------------
+    elif addr == mmap.DAC_SETUP:
+        if rw_flag: dac.init(plan, value)
+
+    elif addr == mmap.DAC_ENABLE:
+        if rw_flag: dac.set_output_mode(plan, value)
+
+    elif addr == mmap.DAC_RESET:
+        if rw_flag:
+            is_por = (value & 0b0100) >> 2
+            ref_en = (value & 0b1000) >> 3
+            if value & 0b01:
+                dac.reset(plan, 1, is_por)
+                dac.set_reference(plan, 1, is_por)
+            if value & 0b10: dac.reset(plan, 2, ref_en)
+
+    elif addr in mmap.DAC_BLOCK:
+        if rw_flag:
+            target_chan = addr - mmap.DAC_BLOCK[0]
+            dac.write_and_update(plan, target_chan, value)
+        plan.output(lambda raw: value)
+
+    # ----------Telemetry----------------------
+    elif addr == mmap.FPGA_TELEM:
+        for reg in options.FPGA_TELEM_REGS:
+            _plan_register(plan, reg, 0, 0, reg_buffer)
+
+    elif addr == mmap.FPGA_TELEM_TIME:
+        plan.telemetry_time = True
+        plan.output(lambda raw: reg_buffer[addr])
+
+    # ----------Diagnostics--------------------
+    elif addr in mmap.SPI_STATS_BLOCK or addr in mmap.CACHE_STATS_BLOCK or addr in mmap.SCHED_STATS_BLOCK:
+        plan.diagnostics = True
+        plan.output(lambda raw: reg_buffer[addr])
+
+    elif addr == mmap.CACHE_FLUSH:
+        if rw_flag and plan.cache: plan.flush_cache = True
+
+    else: plan.error = 1
+
+def plan_request(addresses, rw_flag, values_in, reg_buffer, cache=None, lut=None, uncached=False):
+    '''Compute every raw access needed by one decoded request
+    addresses: registers of the request, raw or virtual
+    rw_flag: read=0, write=1
+    values_in: decoded values to write, one per address
+    reg_buffer: buffered virtual registers (EDFA, telemetry time, diagnostics), read when the plan runs
+    cache: ShadowCache answering config registers, optional
+    lut: SensorLUT converting the temperature and current channels, default calibration if None
+    uncached: read every raw register from the FPGA, e.g. to verify a write, the cache is refreshed with it
+    returns
+    Plan, ready to run'''
+    plan = Plan(cache, lut, uncached)
+    for addr, value in zip(addresses, values_in):
+        _plan_register(plan, addr, rw_flag, value, reg_buffer)
+    return plan
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import zmq
+import collections
+import time
+import options
+import fpga_map as mmap
+import reg_codec
+
+# Request classes, in priority order
+CLASS_REALTIME    = 0 # PAT pointing: FSM and calibration laser
+CLASS_INTERACTIVE = 1 # command handlers
+CLASS_BACKGROUND  = 2 # housekeeping telemetry, EDFA strings
+CLASSES = [CLASS_REALTIME, CLASS_INTERACTIVE, CLASS_BACKGROUND]
+
+REALTIME_REGS = set([mmap.FSMa, mmap.FSMb, mmap.FSMc, mmap.CAL, mmap.PO1, mmap.PO3, mmap.FRC, mmap.CAMERA_TEMP] + mmap.DAC_BLOCK[4:8])
+BACKGROUND_REGS = set([mmap.EDFA_IN_STR, mmap.EDFA_OUT_STR, mmap.EDFA_CMD, mmap.FPGA_TELEM])
+FSM_DAC_REGS = set(mmap.DAC_BLOCK[4:8])
+
+# Registers read without side effect, one read can answer several requests. The EDFA UART reads pop its FIFO
+MERGEABLE_REGS = set(range(128)) - set([mmap.ERX, mmap.ERF])
+MERGEABLE_REGS.update(mmap.TEMPERATURE_BLOCK + mmap.CURRENT_BLOCK + mmap.EDFA_PARSED_BLOCK + [mmap.EDFA_AGE] + mmap.DAC_BLOCK
+    + [mmap.FPGA_TELEM_TIME] + mmap.SPI_STATS_BLOCK + mmap.CACHE_STATS_BLOCK + mmap.SCHED_STATS_BLOCK)
+
+def request_class(req):
+    if req.addresses is not None:
+        # Scatter-gather: realtime only if every register is, background if any register is
+        if BACKGROUND_REGS.intersection(req.addresses): return CLASS_BACKGROUND
+        if REALTIME_REGS.issuperset(req.addresses): return CLASS_REALTIME
+        return CLASS_INTERACTIVE
+    if req.start_addr in REALTIME_REGS: return CLASS_REALTIME
+    if req.start_addr in BACKGROUND_REGS: return CLASS_BACKGROUND
+    return CLASS_INTERACTIVE
+
+def fsm_setpoint(req):
+    '''returns the (addr, value) pairs of a write to the FSM DAC channels only, None for any other request'''
+    if not req.rw_flag: return None
+    if req.addresses is not None:
+        addresses = req.addresses
+        if not addresses or not FSM_DAC_REGS.issuperset(addresses): return None
+        block = reg_codec.list_codec(addresses)
+    else:
+        addresses = range(req.start_addr, req.start_addr+req.size//4)
+        if not addresses or not FSM_DAC_REGS.issuperset(addresses): return None
+        block = reg_codec.codec(req.start_addr, len(addresses))
+    return zip(addresses, block.decode(req.write_data))
+
+def read_addresses(req):
+    '''returns the registers of a plain read of mergeable registers, None for any other request'''
+    if req.rw_flag or req.samples is not None or req.uncached: return None
+    if req.addresses is not None: addresses = req.addresses
+    else:                         addresses = range(req.start_addr, req.start_addr+req.size//4)
+    if not addresses or not MERGEABLE_REGS.issuperset(addresses): return None
+    return addresses
+
+def request_registers(req):
+    '''returns the registers a request touches'''
+    if req.addresses is not None: return req.addresses
+    if mmap.REGISTER_TYPE[req.start_addr] == 'str': return [req.start_addr]
+    return range(req.start_addr, req.start_addr+max(1, req.size//4))
+
+class Scheduler:
+    '''Drains the request socket into one queue per class and hands requests out by priority.
+    A request waiting for more than SCHED_STARVATION_LIMIT is served first, oldest first.
+    Requests of a single client are never reordered. While the client has a deferred answer pending,
+    its requests touching the registers of that job wait, and so do its later requests touching theirs.
+    Requests still queued at their deadline are dropped, nobody waits for their answer anymore.'''
+    def __init__(self, ipc_server):
+        self.ipc_server = ipc_server
+        self.queues = [collections.deque() for cls in CLASSES]
+        self.pending = {}
+        self.held = {}
+        self.served = [0]*len(CLASSES)
+        self.wait_total = [0.0]*len(CLASSES)
+        self.wait_max = [0.0]*len(CLASSES)
+        self.fsm_coalesced = 0
+        self.reads_merged = 0
+        self.reads_saved = 0
+        self.shed = [0]*len(CLASSES)
+        self.last_stamp = 0
+        self.busy_at = 0
+
+    def enqueue(self, req):
+        # Never put a request ahead of an older one from the same client
+        counts = self.pending.setdefault(req.return_addr, [0]*len(CLASSES))
+        cls = request_class(req)
+        for lower in CLASSES[cls+1:]:
+            if counts[lower]: cls = lower
+        counts[cls] += 1
+        self.busy_at = time.time()
+        self.queues[cls].append((self.busy_at, req))
+
+    def drain(self, timeout):
+        '''Queue every request waiting on the socket.
+        Waits up to timeout ms for one only when there is nothing left to serve.'''
+        if not self.servable() and not self.ipc_server.poll(timeout): return
+        while 1:
+            try:
+                req = self.ipc_server.get_request(block=False)
+            except zmq.ZMQError as e:
+                if e.errno == zmq.EAGAIN: return
+                raise
+            self.enqueue(req)
+
+    def servable(self):
+        '''True if a queued request can be served now'''
+        return bool(self._heads())
+
+    def idle(self, now):
+        '''seconds since a request was last queued or served, 0 while one can be served'''
+        if self.servable(): return 0.0
+        return now - self.busy_at
+
+    def hold(self, req, registers=None):
+        '''The answer to req is deferred, keep the requests of its client touching registers queued.
+        registers None holds every request of the client'''
+        if registers is not None: registers = frozenset(registers)
+        self.held.setdefault(req.return_addr, {})[id(req)] = registers
+
+    def release(self, req):
+        held = self.held.get(req.return_addr, {})
+        held.pop(id(req), None)
+        if not held: self.held.pop(req.return_addr, None)
+
+    def _footprints(self):
+        '''returns the registers held per client, a copy _blocked() can extend'''
+        return dict((client, list(held.values())) for client, held in self.held.items())
+
+    def _blocked(self, req, footprints):
+        '''True if req touches registers held for its client. A blocked request holds its own registers in turn,
+        so the later requests of the client never pass it'''
+        held = footprints.get(req.return_addr)
+        if not held: return False
+        registers = request_registers(req)
+        for footprint in held:
+            if footprint is None or not footprint.isdisjoint(registers):
+                held.append(frozenset(registers))
+                return True
+        return False
+
+    def _heads(self):
+        '''returns the oldest servable entry of each class, as (stamp, cls, idx).
+        The classes are scanned in order, as a client's later requests are never in a higher class'''
+        footprints = self._footprints()
+        heads = []
+        for cls in CLASSES:
+            head = None
+            for idx, (stamp, req) in enumerate(self.queues[cls]):
+                if self._blocked(req, footprints): continue
+                if head is None:
+                    head = (stamp, cls, idx)
+                    # Past the head only the blocked requests matter, they hold registers for the next classes
+                    if not footprints: break
+            if head is not None: heads.append(head)
+        return heads
+
+    def next_request(self):
+        '''returns the next request to serve, None if nothing can be served'''
+        now = time.time()
+        self.shed_expired(now)
+
+        heads = self._heads()
+        if not heads: return None
+
+        starving = [head for head in heads if now - head[0] > options.SCHED_STARVATION_LIMIT]
+        if starving: stamp, cls, idx = min(starving)
+        else:        stamp, cls, idx = heads[0]
+
+        stamp, req = self.queues[cls][idx]
+        del self.queues[cls][idx]
+        counts = self.pending[req.return_addr]
+        counts[cls] -= 1
+        if not any(counts): del self.pending[req.return_addr]
+
+        wait = now - stamp
+        self.busy_at = now
+        self.last_stamp = stamp
+        self.served[cls] += 1
+        self.wait_total[cls] += wait
+        self.wait_max[cls] = max(self.wait_max[cls], wait)
+        return req
+
+    def shed_expired(self, now):
+        '''Drop the queued requests past their deadline, answering those that asked for it'''
+        for cls in CLASSES:
+            expired = [entry for entry in self.queues[cls] if entry[1].deadline is not None and entry[1].deadline < now]
+            for entry in expired:
+                self._remove(cls, entry)
+                entry[1].expire()
+            self.shed[cls] += len(expired)
+
+    def take_fsm_updates(self):
+        '''Dequeue the realtime FSM DAC writes queued after the last request served, oldest first.
+        A client's writes are only taken up to its first other request, so they never pass it.
+        returns
+        list of (request, setpoint)'''
+        queue = self.queues[CLASS_REALTIME]
+        footprints = self._footprints()
+        blocked = set()
+        taken = []
+        for entry in list(queue):
+            stamp, req = entry
+            if stamp < self.last_stamp or req.return_addr in blocked or self._blocked(req, footprints): continue
+            setpoint = fsm_setpoint(req)
+            if setpoint is None:
+                blocked.add(req.return_addr)
+                continue
+            self._remove(CLASS_REALTIME, entry)
+            taken.append((req, setpoint))
+        self.fsm_coalesced += len(taken)
+        return taken
+
+    def take_reads(self, addresses):
+        '''Dequeue the plain reads that can share the read of addresses, the request being served, oldest first.
+        Nothing queued after a write is taken, so writes keep their order with every read,
+        and a client's reads are only taken up to its first other request.
+        At most MERGE_MAX_REGS distinct registers are read.
+        returns
+        list of (request, addresses)'''
+        entries = sorted([(stamp, cls, req) for cls in CLASSES for stamp, req in self.queues[cls]], key=lambda entry: entry[0])
+        merged = set(addresses)
+        asked = len(addresses)
+        footprints = self._footprints()
+        blocked = set()
+        taken = []
+        for stamp, cls, req in entries:
+            if req.return_addr in blocked or self._blocked(req, footprints): continue
+            if req.rw_flag: break
+            read = read_addresses(req)
+            if read is None or len(merged.union(read)) > options.MERGE_MAX_REGS:
+                blocked.add(req.return_addr)
+                continue
+            self._remove(cls, (stamp, req))
+            merged.update(read)
+            asked += len(read)
+            taken.append((req, read))
+        self.reads_merged += len(taken)
+        self.reads_saved += asked - len(merged)
+        return taken
+
+    def _remove(self, cls, entry):
+        '''Dequeue an entry out of order'''
+        stamp, req = entry
+        self.queues[cls].remove(entry)
+        counts = self.pending[req.return_addr]
+        counts[cls] -= 1
+        if not any(counts): del self.pending[req.return_addr]
+
+    def update_regs(self, regs):
+        '''Copy the queue metrics in a virtual register buffer'''
+        for cls in CLASSES:
+            regs[mmap.SCHED_DEPTH_BLOCK[cls]] = len(self.queues[cls])
+            if self.served[cls]: regs[mmap.SCHED_WAIT_BLOCK[cls]] = self.wait_total[cls]/self.served[cls]
+            else:                regs[mmap.SCHED_WAIT_BLOCK[cls]] = 0.0
+            regs[mmap.SCHED_MAX_WAIT_BLOCK[cls]] = self.wait_max[cls]
+            regs[mmap.SCHED_SHED_BLOCK[cls]] = self.shed[cls]
+        regs[mmap.SCHED_FSM_COALESCED] = self.fsm_coalesced
+        regs[mmap.SCHED_READS_MERGED] = self.reads_merged
+        regs[mmap.SCHED_READS_SAVED] = self.reads_saved
+        return regs
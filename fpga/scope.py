@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import time
+import options
+import fpga_map as mmap
+import ipc_packets
+
+COUNTERS = [mmap.SCTa, mmap.SCTb, mmap.SCAa, mmap.SCAb, mmap.SCBa, mmap.SCBb, mmap.SCCa, mmap.SCCb]
+
+# Registers of the sweep job
+REGISTERS = [mmap.BIST_SWEEP, mmap.SCN, mmap.SCF, mmap.DAC_1_A, mmap.DAC_1_B, mmap.DAC_1_C] + COUNTERS
+
+def sweep(req, access, start, stop, step, repeats):
+    '''Job running BIST captures for thresholds xrange(start, stop, step) on DAC_1 A-C, repeats times each.
+    The thresholds are set in one transfer, the capture is started BIST_SETTLE later,
+    then the done flag and the counters are polled in one transfer.
+    access(addresses, rw_flag, values) runs one planned request and returns (error count, values).
+    Answers req with an FPGABistSweepResultPacket, error flag set if a capture fails or times out.'''
+    thresholds = xrange(start, stop, step) if step else []
+    counts = []
+    error = int(len(thresholds)*repeats > options.BIST_MAX_CAPTURES)
+
+    for threshold in thresholds:
+        if error: break
+        for idx in range(repeats):
+            error = access([mmap.SCN, mmap.DAC_1_A, mmap.DAC_1_B, mmap.DAC_1_C], 1, [0, threshold, threshold, threshold])[0]
+            if error: break
+            yield options.BIST_SETTLE
+            error = access([mmap.SCN], 1, [mmap.SCN_RUN_CAPTURE])[0]
+            if error: break
+
+            started = time.time()
+            while 1:
+                error, values = access([mmap.SCF] + COUNTERS, 0, [0]*(1+len(COUNTERS)))
+                if error or values[0] & mmap.SCF_CAPTURE_DONE: break
+                if time.time() - started > options.BIST_CAPTURE_TIMEOUT:
+                    error = 1
+                    break
+                yield options.BIST_POLL_PD
+            if error: break
+
+            lsbs, msbs = values[1::2], values[2::2]
+            counts.append([lsb + msb*256 for lsb, msb in zip(lsbs, msbs)])
+
+    if error:
+        req.answer('',error_flag=1)
+        return
+    result = ipc_packets.FPGABistSweepResultPacket()
+    req.answer(result.encode(len(thresholds), repeats, counts))
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import options
+import fpga_map as mmap
+import time
+
+class ShadowCache:
+    '''Write-through copy of the FPGA registers that only change when written.
+    Volatile registers are never stored.'''
+    def __init__(self):
+        self.values = {}
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, addr):
+        '''returns the cached value of addr, None if it has to be read from the FPGA'''
+        reg_class = mmap.REGISTER_CLASS[addr]
+        if reg_class == mmap.REG_VOLATILE: return None
+
+        entry = self.values.get(addr)
+        if entry is not None:
+            value, stamp = entry
+            if time.time() - stamp < options.REG_CACHE_GOOD_FOR:
+                self.hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    def store(self, addr, value):
+        if mmap.REGISTER_CLASS[addr] != mmap.REG_VOLATILE:
+            self.values[addr] = (value, time.time())
+
+    def flush(self):
+        self.values = {}
+
+    def update_regs(self, regs):
+        '''Copy the counters in a virtual register buffer'''
+        regs[mmap.CACHE_HITS]   = self.hits
+        regs[mmap.CACHE_MISSES] = self.misses
+        return regs
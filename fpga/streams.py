@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import time
+import options
+import fpga_map as mmap
+import ipc_packets
+import reg_codec
+import planner
+
+class Stream:
+    def __init__(self, stream_id, addresses, period):
+        self.stream_id = stream_id
+        self.addresses = addresses
+        self.period = period
+        self.codec = reg_codec.list_codec(addresses)
+        self.leases = {} # client: lease end
+        self.due = 0
+
+class Publisher:
+    '''Samples the subscribed register sets and publishes the values on the stream socket.
+    Subscribers of the same addresses and period share one stream, sampled once per period.
+    A subscription is a lease, renewed by subscribing again, that ends after STREAM_LEASE.'''
+    def __init__(self, ipc_server, fpgabus, plan_reads):
+        self.ipc_server = ipc_server
+        self.fpgabus = fpgabus
+        self.plan_reads = plan_reads
+        self.streams = {}
+        self.keys = {}
+        self.next_id = 1
+
+    def subscribe(self, client, period_ms, addresses):
+        '''returns the stream id, None if the addresses cannot be streamed'''
+        addresses = tuple(addresses)
+        period = max(options.STREAM_MIN_PERIOD, period_ms/1000.0)
+        key = (addresses, period)
+        stream_id = self.keys.get(key)
+        if stream_id is None:
+            if not self._streamable(addresses): return None
+            stream_id = self.next_id
+            self.next_id += 1
+            self.streams[stream_id] = Stream(stream_id, addresses, period)
+            self.keys[key] = stream_id
+        self.streams[stream_id].leases[client] = time.time() + options.STREAM_LEASE
+        return stream_id
+
+    def unsubscribe(self, client, stream_id):
+        stream = self.streams.get(stream_id)
+        if stream is None: return
+        stream.leases.pop(client, None)
+        if not stream.leases: self._drop(stream)
+
+    def _streamable(self, addresses):
+        # Only registers read as one value each, strings excluded
+        if not addresses: return False
+        if 'str' in [mmap.REGISTER_TYPE[addr] for addr in addresses]: return False
+        plan = planner.plan_request(addresses, 0, [0]*len(addresses), {})
+        return not plan.error and len(plan.outputs) == len(addresses)
+
+    def _drop(self, stream):
+        del self.streams[stream.stream_id]
+        del self.keys[(stream.addresses, stream.period)]
+
+    def tick(self):
+        '''Publish a frame of every stream that is due'''
+        now = time.time()
+        for stream in self.streams.values():
+            for client, end in stream.leases.items():
+                if end < now: del stream.leases[client]
+            if not stream.leases:
+                self._drop(stream)
+                continue
+            if stream.due > now: continue
+            stream.due += stream.period
+            if stream.due <= now: stream.due = now + stream.period
+
+            error, values = self.plan_reads(stream.addresses).run(self.fpgabus)
+            if error: continue
+            frame = ipc_packets.FPGAStreamFramePacket()
+            self.ipc_server.publish(frame.encode(stream.stream_id, now, stream.codec.encode(values)))
+
+    def timeout(self, default):
+        '''ms the server can wait for requests before the next frame is due'''
+        if not self.streams: return default
+        wait = min([stream.due for stream in self.streams.values()]) - time.time()
+        return max(0, min(default, int(1000*wait)))
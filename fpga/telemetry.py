@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import options
+import fpga_map as mmap
+import planner
+import struct
+import time
+
+class Snapshot:
+    '''Builds the FPGA_TELEM vector in the background, FPGA_TELEM_CHUNK registers per tick.
+    The finished vector is kept packed as FPGA_TELEM_TYPE so reads are answered as is.'''
+    def __init__(self, fpgabus, reg_buffer, cache, sampler, lut=None):
+        self.fpgabus = fpgabus
+        self.reg_buffer = reg_buffer
+        self.cache = cache
+        self.lut = lut
+        self.sampler = sampler
+        
+        self.regs = options.FPGA_TELEM_REGS
+        self.packer = struct.Struct(''.join(mmap.FPGA_TELEM_TYPE))
+        self.values = [0]*len(self.regs)
+        self.next = 0
+        self.sweep_start = 0
+        
+        self.raw = None
+        self.stamp = 0
+        
+    def tick(self):
+        '''Read the next chunk of telemetry registers if a refresh is due'''
+        if self.raw and time.time() - self.stamp < options.FPGA_TELEM_PD: return
+        
+        if self.next == 0: self.sweep_start = time.time()
+        
+        chunk = self.regs[self.next:self.next+options.FPGA_TELEM_CHUNK]
+        plan = planner.plan_request(chunk, 0, [0]*len(chunk), self.reg_buffer, self.cache, self.lut)
+        if plan.edfa_needed: self.sampler.update_regs(self.reg_buffer)
+        error, values = plan.run(self.fpgabus)
+        
+        self.values[self.next:self.next+len(chunk)] = values
+        self.next += len(chunk)
+        
+        if self.next >= len(self.regs):
+            self.raw = self.packer.pack(*self.values)
+            self.stamp = self.sweep_start
+            self.next = 0
+            
+    def get_raw(self):
+        '''Packed telemetry, swept once in full if no snapshot exists yet'''
+        while self.raw is None: self.tick()
+        return self.raw
+        
+    def update_regs(self, regs):
+        regs[mmap.FPGA_TELEM_TIME] = int(self.stamp)
+        return regs
@@ -48,6 +48,8 @@ HE2 = 38 #Heater 2
 DFPa = 47
 DFPb = 48
 
+FRC = 53 # Free running counter, polled by PAT to check the link
+
 FLG = 63
 FLG_DCM_LOCKED = 0b00000001
 FLG_CRC_ERROR  = 0b00010000
@@ -90,6 +92,11 @@ SPH = 28
 
 
 REGISTER_TYPE = collections.defaultdict(lambda : 'xxxx')
+
+# Register volatility, decides if the server can answer a read from its shadow cache
+REG_VOLATILE = 0 # changes on its own, always read from the FPGA
+REG_CONFIG   = 1 # only changes when written, cached for options.REG_CACHE_GOOD_FOR
+REGISTER_CLASS = collections.defaultdict(lambda : REG_VOLATILE)
 BYTE_1 = {}
 BYTE_2 = {}
 BYTE_3 = {}
@@ -99,6 +106,11 @@ BYTE_4 = {}
 for reg in range(  0, 128):
     REGISTER_TYPE[reg] = 'xxxB'
 
+# Written by software only: seed set points, power switches, BIST timebase.
+# PO1 stays volatile: PAT reads it as a live check of the LD bias
+for reg in [LTSa, LTSb, LBCa, LBCb, DEL, CAL, PO2, PO3, PO4, HE1, HE2, SCP, SCD, SPL, SPH]:
+    REGISTER_CLASS[reg] = REG_CONFIG
+
 class Power:
     def __init__(self, handler):
         self.handler = handler
@@ -251,6 +263,10 @@ EDFA_PUMP_CURRENT = 610
 REGISTER_TYPE[EDFA_PUMP_CURRENT] = 'I'
 EDFA_CASE_TEMP = 611
 REGISTER_TYPE[EDFA_CASE_TEMP] = 'f'
+EDFA_AGE = 612 # seconds since the parsed EDFA registers were sampled
+REGISTER_TYPE[EDFA_AGE] = 'f'
+EDFA_CMD       = 613 # queued command, answered with the EDFA reply line once it is complete
+REGISTER_TYPE[EDFA_CMD] = 'str'
 
 
 class EDFA:
@@ -263,6 +279,10 @@ class EDFA:
     def read_string(self):
         return self.handler.read_reg(EDFA_OUT_STR)
 
+    def send_command_async(self,tx_str):
+        '''Queue a command on the FPGA server, the future gives the EDFA reply line'''
+        return self.handler.write_reg_async(EDFA_CMD,tx_str)
+
     def send_command(self,tx_str):
         self.handler.write_reg(EDFA_IN_STR,tx_str)
         res_str = self.handler.read_reg(EDFA_OUT_STR)
@@ -314,12 +334,68 @@ class EDFA:
     def get_case_temp(self):
         return self.handler.read_reg(EDFA_CASE_TEMP)
 
+# ----------------- Modulator -----------------
+MOD_FIFO = 700 # write a buffer of symbols, one character each, streamed into DATA by the server
+REGISTER_TYPE[MOD_FIFO] = 'str'
+
 #Standard FPGA Telemetry packet
+FPGA_TELEM_TIME = 799 # unix time at which the FPGA_TELEM snapshot was sampled
+REGISTER_TYPE[FPGA_TELEM_TIME] = 'I'
 FPGA_TELEM = 800
 FPGA_TELEM_TYPE = [REGISTER_TYPE[reg] for reg in options.FPGA_TELEM_REGS]
 for reg in range(800, 800+len(options.FPGA_TELEM_REGS)):
     REGISTER_TYPE[reg] = FPGA_TELEM_TYPE[reg-800]
 
+# ----------------- Server diagnostics -----------------
+SPI_STATS_BLOCK = list(range(900, 905))
+SPI_TRANSFERS, SPI_BYTES, SPI_ADDR_ERRORS, SPI_TIME, SPI_REOPENS = SPI_STATS_BLOCK[0:5]
+for reg in SPI_STATS_BLOCK:
+    REGISTER_TYPE[reg] = 'I'
+REGISTER_TYPE[SPI_TIME] = 'f'
+
+CACHE_STATS_BLOCK = list(range(910, 912))
+CACHE_HITS, CACHE_MISSES = CACHE_STATS_BLOCK[0:2]
+for reg in CACHE_STATS_BLOCK:
+    REGISTER_TYPE[reg] = 'I'
+CACHE_FLUSH = 912 # write anything to drop the shadow cache, e.g. after reflashing the FPGA
+REGISTER_TYPE[CACHE_FLUSH] = 'xxxB'
+
+# Request queues: realtime, interactive, background
+SCHED_DEPTH_BLOCK    = list(range(920, 923)) # requests waiting
+SCHED_WAIT_BLOCK     = list(range(923, 926)) # mean wait before service, seconds
+SCHED_MAX_WAIT_BLOCK = list(range(926, 929)) # longest wait before service, seconds
+SCHED_FSM_COALESCED  = 929 # FSM DAC writes merged into an earlier queued one, latest value wins
+SCHED_READS_MERGED   = 936 # read requests served by the read of another queued request
+SCHED_READS_SAVED    = 937 # register reads saved by merging, registers asked by several merged requests
+SCHED_SHED_BLOCK     = list(range(938, 941)) # requests dropped at their deadline, before being served
+SCHED_COUNTERS = [SCHED_FSM_COALESCED, SCHED_READS_MERGED, SCHED_READS_SAVED] + SCHED_SHED_BLOCK
+SCHED_STATS_BLOCK = SCHED_DEPTH_BLOCK + SCHED_WAIT_BLOCK + SCHED_MAX_WAIT_BLOCK + SCHED_COUNTERS
+for reg in SCHED_DEPTH_BLOCK + SCHED_COUNTERS:
+    REGISTER_TYPE[reg] = 'I'
+for reg in SCHED_WAIT_BLOCK + SCHED_MAX_WAIT_BLOCK:
+    REGISTER_TYPE[reg] = 'f'
+
+# ----------------- Register streams -----------------
+STREAM_SUBSCRIBE   = 930 # write an FPGAStreamSubscribePacket, answered with the stream id
+STREAM_UNSUBSCRIBE = 931 # write a stream id to end the lease of the client
+REGISTER_TYPE[STREAM_SUBSCRIBE] = 'str'
+REGISTER_TYPE[STREAM_UNSUBSCRIBE] = 'I'
+
+# ----------------- Register macros -----------------
+MACRO = 932 # write an FPGAMacroPacket, answered with an FPGAMacroResultPacket once it has run
+REGISTER_TYPE[MACRO] = 'str'
+
+WAIT_COND = 933 # write an FPGAWaitPacket, answered with an FPGAWaitResultPacket when the condition is met or times out
+REGISTER_TYPE[WAIT_COND] = 'str'
+
+# ----------------- Seed laser alignment -----------------
+SEED_ALIGN = 934 # write an FPGAAlignPacket, answered with an FPGAAlignResultPacket once the TEC scan is done
+REGISTER_TYPE[SEED_ALIGN] = 'str'
+
+# ----------------- BIST -----------------
+BIST_SWEEP = 935 # write an FPGABistSweepPacket, answered with an FPGABistSweepResultPacket of every capture
+REGISTER_TYPE[BIST_SWEEP] = 'str'
+
 '''
 REGISTERS = [None] * 300 # [encoding B = byte, I = unsigned int, ? = bool, [physical registers, least to most significant bits], rw flag]
 
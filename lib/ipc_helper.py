@@ -5,8 +5,10 @@ import options
 import os
 import struct
 import fpga_map
-import collections
+import reg_codec
 import uuid
+import threading
+import time
 
 class FPGAClientInterface:
     def __init__(self,context=None):
@@ -18,21 +20,54 @@ class FPGAClientInterface:
         # ZeroMQ context setup
         if not context: context = zmq.Context()
         
-        # FPGA request socket
-        self.socket_request = context.socket(zmq.PUB)
-        self.socket_request.connect("tcp://localhost:%s" % options.FPGA_MAP_REQUEST_PORT)
+        if options.FPGA_MAP_USES_ROUTER:
+            # One DEALER socket, the server routes the answers back to it.
+            # Only the relay thread uses it: requests reach it through an inproc pipe and answers leave through another,
+            # so reading the answers never holds up the senders
+            self.socket_dealer = context.socket(zmq.DEALER)
+            self.socket_dealer.connect(options.FPGA_MAP_ENDPOINT)
+            
+            relay_request = context.socket(zmq.PAIR)
+            relay_request.bind("inproc://fpga_map_request_%d" % self.pid)
+            self.socket_request = context.socket(zmq.PAIR)
+            self.socket_request.connect("inproc://fpga_map_request_%d" % self.pid)
+            
+            relay_answer = context.socket(zmq.PAIR)
+            relay_answer.bind("inproc://fpga_map_answer_%d" % self.pid)
+            self.socket_answer = context.socket(zmq.PAIR)
+            self.socket_answer.connect("inproc://fpga_map_answer_%d" % self.pid)
+            
+            relay = threading.Thread(target=self._relay, args=(relay_request, relay_answer))
+            relay.daemon = True
+            relay.start()
+        else:
+            self.socket_dealer = None
+            
+            # FPGA request socket
+            self.socket_request = context.socket(zmq.PUB)
+            self.socket_request.connect("tcp://localhost:%s" % options.FPGA_MAP_REQUEST_PORT)
+            
+            # FPGA answer socket
+            self.socket_answer = context.socket(zmq.SUB)
+            self.socket_answer.setsockopt(zmq.SUBSCRIBE, struct.pack('I',self.pid)) # Filter only your own packets
+            self.socket_answer.connect("tcp://localhost:%s" % options.FPGA_MAP_ANSWER_PORT)
         
-        # FPGA answer socket
-        self.socket_answer = context.socket(zmq.SUB)
-        self.socket_answer.setsockopt(zmq.SUBSCRIBE, struct.pack('I',self.pid)) # Filter only your own packets
-        self.socket_answer.connect("tcp://localhost:%s" % options.FPGA_MAP_ANSWER_PORT)
+        # kept for the register stream sockets
+        self.context = context
         
-        self._token = 0
-        self._pending = collections.deque()
+        # Answers are matched to their future by request id, in any order.
+        # Any thread can send; one thread at a time reads the answer socket for everyone.
+        self._request_id = 0
+        self._pending = {}
+        self._window = threading.BoundedSemaphore(options.FPGA_MAX_IN_FLIGHT)
+        self._send_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._recv_lock = threading.Lock()
+        self._answered = threading.Condition()
         
         # checking if FPGA is here for 5 sec.
         tries = 50
-        self.socket_answer.setsockopt(zmq.RCVTIMEO, 100) # Set timout
+        self._set_timeout(100)
         while 1:
             try:
                 self.write_reg(127,'')
@@ -41,7 +76,7 @@ class FPGAClientInterface:
                 tries -= 1
                 if tries == 0:
                     raise error   
-        self.socket_answer.setsockopt(zmq.RCVTIMEO, options.MESSAGE_TIMEOUT) # Set timout
+        self._set_timeout(options.MESSAGE_TIMEOUT)
         
         self.power = fpga_map.Power(self)
         self.edfa  = fpga_map.EDFA(self)
@@ -56,10 +91,19 @@ class FPGAClientInterface:
             self.size = size
             self.value = None
             self.valid = False
-            self.time_out = False
+            self.error = False
+            self.expired = False
+            self.time_out = None
+            self.deadline = None # answers of long server jobs are waited for until then
+            
+        def done(self):
+            return self.valid or self.error or self.time_out is not None
             
         def wait(self):
-            if not self.valid: self.handler._receive(self)
+            self.handler._receive_until(self.done)
+            if self.time_out is not None: raise self.time_out
+            if self.expired: raise ValueError('FPGA request dropped at its deadline')
+            if self.error: raise ValueError('Error flag set on FPGA answer')
             return self.value
                 
     def verify_boot(self):
@@ -70,13 +114,27 @@ class FPGAClientInterface:
         return (dcm_locked and not crc_err)
     
     def _get_token(self):
-        self._token = (self._token+1) % 255
-        return self._token
+        with self._pending_lock:
+            self._request_id = (self._request_id+1) % 2**32
+            return self._request_id
     
-    def read_reg_async(self,addr,size=1):
-        '''Write registers and send typed result'''
+    def _track(self,future):
+        '''Register a future before its request is sent, waits while the in-flight window is full'''
+        acquired = [False]
+        def slot():
+            if not acquired[0]: acquired[0] = self._window.acquire(False)
+            return acquired[0]
+        self._receive_until(slot)
+        with self._pending_lock:
+            self._pending[future.token] = future
+        
+    def read_reg_async(self,addr,size=1,uncached=False):
+        '''Write registers and send typed result
+        - uncached: read the FPGA even if the server has the registers cached, to verify a write'''
         
         request_id = self._get_token()
+        future = FPGAClientInterface._Future(self,request_id,addr,0,4*size)
+        self._track(future)
     
         # send request
         self._send_request(
@@ -84,127 +142,399 @@ class FPGAClientInterface:
             start_address = addr,
             rw_flag = 0,
             size = size*4,
-            data = '')
+            data = '',
+            uncached = uncached)
     
-        future = FPGAClientInterface._Future(self,request_id,addr,0,4*size)
-        self._pending.append(future)
         return future
     
-    def write_reg_async(self,addr,value):
+    def write_reg_async(self,addr,value,timeout=None):
         '''Write registers:
         - addr: start address
         - value:
             int will be sent as unsigned 32 bits int
             list of ints will be sent as len * unsigned 32 bits ints
-            str or bytes will be sent directly if len(str) is a multiple of 4'''
+            str or bytes will be sent directly if len(str) is a multiple of 4
+        - timeout: seconds to wait for the answer, for requests the server takes long to answer'''
             
         request_id = self._get_token()
             
         # encode payload based on type
         if type(value) is int:
             len_pck = 4
-            frmt = fpga_map.REGISTER_TYPE[addr]
-            payload = struct.pack(frmt,value)
+            payload = reg_codec.codec(addr,1).encode([value])
         elif type(value) is list:
-            len_pck = len(value)
-            frmt = ''.join([fpga_map.REGISTER_TYPE[ad] for ad in xrange(addr,addr+len_pck)])
-            payload = struct.pack(frmt,*value)
-            len_pck *= 4
+            len_pck = len(value)*4
+            payload = reg_codec.codec(addr,len(value)).encode(value)
         elif type(value) is str:
-            lstr = len(value)
-            value = value + 'X'*(-lstr%4)
-            payload = struct.pack('I',lstr) + value
+            payload = reg_codec.encode_str(value)
             len_pck = len(payload)
         else:
             raise TypeError('Can only send int, list, or string')
         
+        future = FPGAClientInterface._Future(self,request_id,addr,1,len_pck)
+        if timeout is not None: future.deadline = time.time() + timeout
+        self._track(future)
+        
         # send request
         self._send_request(
             request_number = request_id,
             start_address = addr,
             rw_flag = 1,
             size = len_pck,
-            data = payload)
+            data = payload,
+            deadline = future.deadline)
            
-        future = FPGAClientInterface._Future(self,request_id,addr,1,len_pck)
-        self._pending.append(future)
         return future
         
-    def write_reg(self,addr,value):
-        future = self.write_reg_async(addr,value)
+    def read_regs_async(self,addresses,uncached=False):
+        '''Read any list of registers, raw or virtual, in one request
+        - addresses: list of registers, the result is the list of their values in the same order
+        - uncached: read the FPGA even if the server has the registers cached, to verify a write'''
+        
+        addresses = list(addresses)
+        if not addresses: raise ValueError('No register to read')
+        request_id = self._get_token()
+        future = FPGAClientInterface._Future(self,request_id,addresses[0],0,4*len(addresses))
+        self._track(future)
+        
+        self._send_request(
+            request_number = request_id,
+            start_address = addresses[0],
+            rw_flag = 0,
+            size = 4*len(addresses),
+            data = '',
+            addresses = addresses,
+            uncached = uncached)
+        
+        return future
+        
+    def write_regs_async(self,values):
+        '''Write any set of registers in one request:
+        - values: dict {addr: value}, written in address order,
+            or list of (addr, value) pairs, written in the list order'''
+        
+        if type(values) is dict: values = sorted(values.items())
+        addresses = [addr for addr, value in values]
+        if not addresses: raise ValueError('No register to write')
+        payload = reg_codec.list_codec(addresses).encode([value for addr, value in values])
+        
+        request_id = self._get_token()
+        future = FPGAClientInterface._Future(self,request_id,addresses[0],1,len(payload))
+        self._track(future)
+        
+        self._send_request(
+            request_number = request_id,
+            start_address = addresses[0],
+            rw_flag = 1,
+            size = len(payload),
+            data = payload,
+            addresses = addresses)
+        
+        return future
+        
+    def oversample_async(self,addr,samples,size=1):
+        '''Read size registers from addr samples times each, OVERSAMPLE_PD apart,
+        the result is the (mean, min, max, std) of each register'''
+        
+        request_id = self._get_token()
+        future = FPGAClientInterface._Future(self,request_id,addr,0,16*size)
+        future.deadline = time.time() + samples*options.OVERSAMPLE_PD + options.MESSAGE_TIMEOUT/1000.0
+        self._track(future)
+        
+        self._send_request(
+            request_number = request_id,
+            start_address = addr,
+            rw_flag = 0,
+            size = size*4,
+            data = '',
+            samples = samples,
+            deadline = future.deadline)
+        
+        return future
+        
+    def write_reg(self,addr,value,timeout=None):
+        future = self.write_reg_async(addr,value,timeout)
         return future.wait()
     
-    def read_reg(self,addr,size=1):
-        future = self.read_reg_async(addr,size)
+    def read_reg(self,addr,size=1,uncached=False):
+        future = self.read_reg_async(addr,size,uncached)
+        return future.wait()
+        
+    def wait_reg_async(self,addr,mask,value,period=0.001,timeout=1.0):
+        '''Ask the server to poll addr until addr & mask == value
+        - period: seconds between polls
+        - timeout: seconds before giving up'''
+        pck = ipc_packets.FPGAWaitPacket()
+        raw = pck.encode(addr, mask, value, int(period*1e6), int(timeout*1000))
+        return self.write_reg_async(fpga_map.WAIT_COND, raw, timeout + options.MESSAGE_TIMEOUT/1000.0)
+        
+    def wait_reg(self,addr,mask,value,period=0.001,timeout=1.0):
+        '''returns
+        True if the condition was met, False on timeout
+        last value read
+        seconds the server waited'''
+        pck = ipc_packets.FPGAWaitResultPacket()
+        matched, elapsed, read_data = pck.decode(self.wait_reg_async(addr,mask,value,period,timeout).wait())
+        return bool(matched), reg_codec.list_codec([addr]).decode(read_data)[0], elapsed
+        
+    def align_seed(self,center,window,band_low=0.0,band_high=0.0):
+        '''Ask the server to scan the seed laser TEC setpoint around center, see FPGAAlignPacket
+        returns
+        True if the setpoint is in the power band
+        TEC setpoint applied, LTSa*256 + LTSb
+        list of (setpoint, EDFA input power in dBm) measured'''
+        pck = ipc_packets.FPGAAlignPacket()
+        points = 2*window + 1
+        duration = points*(options.ALIGN_SETTLE_TIMEOUT + options.ALIGN_AVERAGE*options.EDFA_READ_WRITE_DELAY)
+        raw = self.write_reg(fpga_map.SEED_ALIGN, pck.encode(center, window, band_low, band_high), duration + options.MESSAGE_TIMEOUT/1000.0)
+        matched, setpoint, curve = ipc_packets.FPGAAlignResultPacket().decode(raw)
+        return bool(matched), setpoint, curve
+        
+    def bist_sweep(self,start,stop,step,repeats=1):
+        '''Ask the server to run BIST captures for thresholds xrange(start, stop, step), repeats times each
+        returns
+        list of (total, A, B, C) counts, one per capture, threshold after threshold'''
+        pck = ipc_packets.FPGABistSweepPacket()
+        captures = len(xrange(start, stop, step))*repeats
+        raw = self.write_reg(fpga_map.BIST_SWEEP, pck.encode(start, stop, step, repeats),
+            captures*(options.BIST_SETTLE + options.BIST_CAPTURE_TIMEOUT) + options.MESSAGE_TIMEOUT/1000.0)
+        return ipc_packets.FPGABistSweepResultPacket().decode(raw)[2]
+        
+    def read_regs(self,addresses,uncached=False):
+        future = self.read_regs_async(addresses,uncached)
         return future.wait()
         
-    def _send_request(self,request_number,start_address,rw_flag,size,data):
-        '''format and send the request IPC packets'''
+    def oversample(self,addr,samples,size=1):
+        '''returns
+        (mean, min, max, std) of samples readings of addr, list of them if size > 1'''
+        future = self.oversample_async(addr,samples,size)
+        return future.wait()
+        
+    def write_regs(self,values):
+        future = self.write_regs_async(values)
+        return future.wait()
+        
+    def _send_request(self,request_number,start_address,rw_flag,size,data,addresses=None,samples=None,deadline=None,uncached=False):
+        '''format and send the request IPC packets
+        - deadline: unix time after which nobody waits for the answer, MESSAGE_TIMEOUT from now by default.
+            The server drops the request past it and answers that it expired'''
+        if deadline is None: deadline = time.time() + options.MESSAGE_TIMEOUT/1000.0
         pck = ipc_packets.FPGAMapRequestPacket()
         raw = pck.encode(
             return_addr=self.pid,
-            rq_number=request_number,
+            rq_number=request_number & 0xFF,
             rw_flag=rw_flag,
             start_addr=start_address,
             size=size,
-            write_data=data)
-        self.socket_request.send(raw)
+            write_data=data,
+            request_id=request_number,
+            addresses=addresses,
+            samples=samples,
+            deadline=deadline,
+            expired=1,
+            uncached=int(uncached) or None)
+        with self._send_lock:
+            self.socket_request.send(raw)
+        
+    def _relay(self,requests,answers):
+        '''Moves the requests to the DEALER socket and its answers back, owns the DEALER socket'''
+        poller = zmq.Poller()
+        poller.register(requests, zmq.POLLIN)
+        poller.register(self.socket_dealer, zmq.POLLIN)
+        try:
+            while 1:
+                events = dict(poller.poll())
+                if requests in events: self.socket_dealer.send(requests.recv())
+                if self.socket_dealer in events: answers.send(self.socket_dealer.recv())
+        except zmq.ContextTerminated:
+            return
+        
+    def _set_timeout(self,timeout):
+        self.socket_answer.setsockopt(zmq.RCVTIMEO, timeout)
         
     def _get_packet(self):
     
         try:
             message = self.socket_answer.recv()
         except (zmq.ZMQError, zmq.NotDone, zmq.ContextTerminated) as error:
-            for future in self._pending:
-                future.time_out = True
-            self._pending = collections.deque()
-            raise error
+            # Nothing answered in time, fail everything in flight but the long jobs still within their deadline
+            now = time.time()
+            with self._pending_lock:
+                expired = [future for future in self._pending.values() if future.deadline is None or future.deadline < now]
+                for future in expired: del self._pending[future.token]
+            for future in expired:
+                future.time_out = error
+                self._window.release()
+            with self._answered:
+                self._answered.notify_all()
+            return None
             
         pck = ipc_packets.FPGAMapAnswerPacket()
         pck.decode(message)
         return pck
 
-    def _receive(self,target_future):
-    
-        current_fut = None
-    
-        while current_fut != target_future:
-            
-            current_fut = self._pending.popleft()
-            
-            pck = self._get_packet()
-            
-            if options.CHECK_ASSERTS:
-                assert pck.start_addr == current_fut.addr
-                assert pck.rq_number == current_fut.token
-                assert pck.rw_flag == current_fut.wr_flag
-                #assert pck.size == current_fut.size
-            
-            if pck.error:
-                raise ValueError('Error flag set on FPGA answer')
-                
-            current_fut.value = self._decode_payload(pck)
-            current_fut.valid = True
+    def _dispatch(self,pck):
+        '''Complete the future of an answer'''
+        with self._pending_lock:
+            future = self._pending.pop(pck.request_id, None)
+        
+        # Answer of a request that already timed out
+        if future is None: return
+        self._window.release()
+        
+        if options.CHECK_ASSERTS:
+            assert pck.start_addr == future.addr
+            assert pck.rw_flag == future.wr_flag
+            #assert pck.size == future.size
+        
+        if pck.expired: future.expired = True
+        if pck.error: future.error = True
+        else: future.value = self._decode_payload(pck)
+        future.valid = not pck.error
+        
+        with self._answered:
+            self._answered.notify_all()
+
+    def _receive_until(self,done):
+        '''Read answers until done() is true.
+        Only one thread reads the socket, the others wait for it to complete their futures'''
+        while not done():
+            if self._recv_lock.acquire(False):
+                try:
+                    if not done():
+                        pck = self._get_packet()
+                        if pck is not None: self._dispatch(pck)
+                except:
+                    with self._answered:
+                        self._answered.notify_all()
+                    raise
+                finally:
+                    self._recv_lock.release()
+            else:
+                with self._answered:
+                    self._answered.wait(0.01)
     
     def _decode_payload(self,pck):
         if not pck.size: return None
+        if pck.samples is not None:
+            stats = reg_codec.decode_stats(pck.read_data)
+            if len(stats) > 1: return stats
+            else: return stats[0]
+        if pck.addresses is not None:
+            return reg_codec.list_codec(pck.addresses).decode(pck.read_data)
         if fpga_map.REGISTER_TYPE[pck.start_addr] == 'str':
-            lstr = struct.unpack('I',pck.read_data[0:4])[0]
-            return pck.read_data[4:lstr+4]
-        elif pck.size > 4:
-            reg_size = pck.size//4
-            addr_range = range(pck.start_addr, pck.start_addr+reg_size)
-            raw_slices = [pck.read_data[0+i:4+i] for i in range(0, pck.size, 4)]
-            return [self._decode_reg(addr,raw) for addr,raw in zip(addr_range,raw_slices)]
-        else:
-            return self._decode_reg(pck.start_addr,pck.read_data) 
-            
-    def _decode_reg(self,addr,raw):
-        return struct.unpack(fpga_map.REGISTER_TYPE[addr],raw)[0]
+            return reg_codec.decode_str(pck.read_data)
+        values = reg_codec.codec(pck.start_addr, pck.size//4).decode(pck.read_data)
+        if pck.size > 4: return values
+        else: return values[0]
         
     def wait_all(self,*arg):
         return [a.wait() for a in arg] 
         
+    class Subscription:
+        '''Frames of one register stream, sampled by the FPGA server.
+        Every subscriber of the same addresses and period shares the same sampling.
+        The lease is renewed while frames are received, close() ends it.'''
+        def __init__(self,handler,addresses,period):
+            self.handler = handler
+            self.addresses = list(addresses)
+            self.period_ms = int(period*1000)
+            self.codec = reg_codec.list_codec(self.addresses)
+            self.stream_id = None
+            
+            self.socket = handler.context.socket(zmq.SUB)
+            self.socket.setsockopt(zmq.RCVTIMEO, 2*self.period_ms + options.MESSAGE_TIMEOUT)
+            self.socket.connect("tcp://localhost:%s" % options.FPGA_MAP_STREAM_PORT)
+            self.renew()
+            
+        def renew(self):
+            pck = ipc_packets.FPGAStreamSubscribePacket()
+            raw = self.handler.write_reg(fpga_map.STREAM_SUBSCRIBE, pck.encode(self.period_ms, self.addresses))
+            stream_id = struct.unpack('I',raw)[0]
+            
+            # A restarted server hands out a new id
+            if stream_id != self.stream_id:
+                if self.stream_id is not None: self.socket.setsockopt(zmq.UNSUBSCRIBE, struct.pack('I',self.stream_id))
+                self.socket.setsockopt(zmq.SUBSCRIBE, struct.pack('I',stream_id))
+                self.stream_id = stream_id
+            self.renewed = time.time()
+            
+        def recv(self):
+            '''Wait for the next frame
+            returns
+            sampling time, list of values in the order of the addresses'''
+            if time.time() - self.renewed > options.STREAM_LEASE/2.0: self.renew()
+            pck = ipc_packets.FPGAStreamFramePacket()
+            pck.decode(self.socket.recv())
+            return pck.timestamp, self.codec.decode(pck.read_data)
+            
+        def close(self):
+            self.handler.write_reg(fpga_map.STREAM_UNSUBSCRIBE, self.stream_id)
+            self.socket.close()
+            
+    def subscribe(self,addresses,period):
+        '''Ask the server to sample addresses every period seconds and publish them
+        returns
+        Subscription, recv() gives the frames'''
+        return FPGAClientInterface.Subscription(self,addresses,period)
+        
+    class Macro:
+        '''Register sequence executed by the FPGA server in a single exchange.
+        Operations between two waits run without any other request in between.
+        Calls chain, e.g. fpga.macro().read(CTL).set_bits(CTL, 0x8).run()'''
+        def __init__(self,handler):
+            self.handler = handler
+            self.operations = []
+            self.labels = {}
+            
+        def _add(self,opcode,addr=0,operand=0):
+            self.operations.append((opcode,addr,operand))
+            return self
+            
+        def read(self,addr):
+            '''Capture the value of addr, read from the FPGA, also used by the following branches'''
+            return self._add(ipc_packets.MACRO_READ,addr)
+        def write(self,addr,value):        return self._add(ipc_packets.MACRO_WRITE,addr,value)
+        def set_bits(self,addr,bits):      return self._add(ipc_packets.MACRO_SET,addr,bits)
+        def clear_bits(self,addr,bits):    return self._add(ipc_packets.MACRO_CLEAR,addr,bits)
+        def mask(self,bits):
+            '''Bits compared by the following verify and branches'''
+            return self._add(ipc_packets.MACRO_MASK,0,bits)
+        def verify(self,addr,value):
+            '''Capture the value of addr, read from the FPGA, the macro fails if it does not match value'''
+            return self._add(ipc_packets.MACRO_VERIFY,addr,value)
+        def wait(self,seconds):            return self._add(ipc_packets.MACRO_WAIT,0,int(seconds*1000))
+        
+        def label(self,name):
+            '''Name the position of the next operation, target of branches and loops'''
+            self.labels[name] = len(self.operations)
+            return self
+        def branch_eq(self,value,name):    return self._add(ipc_packets.MACRO_BRANCH_EQ,name,value)
+        def branch_ne(self,value,name):    return self._add(ipc_packets.MACRO_BRANCH_NE,name,value)
+        def loop(self,name,count):
+            '''Run the operations from label name to here count times'''
+            return self._add(ipc_packets.MACRO_LOOP,name,count)
+            
+        def encode(self):
+            operations = []
+            for opcode, addr, operand in self.operations:
+                if opcode in (ipc_packets.MACRO_BRANCH_EQ, ipc_packets.MACRO_BRANCH_NE, ipc_packets.MACRO_LOOP):
+                    addr = self.labels[addr]
+                operations.append((opcode,addr,operand))
+            return ipc_packets.FPGAMacroPacket().encode(operations)
+            
+        def run(self):
+            '''Execute the macro, raises ValueError if it failed
+            returns
+            list of (addr, value) captured by read and verify, in execution order'''
+            pck = ipc_packets.FPGAMacroResultPacket()
+            addresses, read_data = pck.decode(self.handler.write_reg(fpga_map.MACRO, self.encode()))
+            return zip(addresses, reg_codec.list_codec(addresses).decode(read_data))
+            
+    def macro(self):
+        '''returns an empty Macro to build'''
+        return FPGAClientInterface.Macro(self)
+        
 class FPGAServerInterface:
     def __init__(self,context=None,timeout=-1):
         
@@ -220,14 +550,33 @@ class FPGAServerInterface:
         self.socket_answer = context.socket(zmq.PUB)
         self.socket_answer.bind("tcp://*:%s" % options.FPGA_MAP_ANSWER_PORT)
         
+        # Python clients: ROUTER on a unix socket, answers go back to the requesting client only.
+        # The PUB/SUB pair above stays for PAT.
+        self.socket_router = context.socket(zmq.ROUTER)
+        self.socket_router.bind(options.FPGA_MAP_ENDPOINT)
+        
+        self.timeout = timeout
+        self.poller = zmq.Poller()
+        self.poller.register(self.socket_request, zmq.POLLIN)
+        self.poller.register(self.socket_router, zmq.POLLIN)
+        
+        # Register stream frames, subscribers filter on the stream id
+        self.socket_stream = context.socket(zmq.PUB)
+        self.socket_stream.bind("tcp://*:%s" % options.FPGA_MAP_STREAM_PORT)
+        
     class Request(ipc_packets.FPGAMapRequestPacket):
-        def __init__(self,handler):
+        def __init__(self,handler,route=None):
             ipc_packets.FPGAMapRequestPacket.__init__(self)
             self.handler = handler
+            self.route = route
             
         def answer(self,data,error_flag=0):
         
             enc_data = self._encode_payload(self.start_addr,data)
+            self.answer_raw(enc_data,error_flag)
+            
+        def answer_raw(self,enc_data,error_flag=0,expired=None):
+            '''Answer with an already encoded payload'''
             
             asw_pck = ipc_packets.FPGAMapAnswerPacket()
             raw = asw_pck.encode(
@@ -237,39 +586,63 @@ class FPGAServerInterface:
                 error_flag = error_flag,
                 start_addr = self.start_addr,
                 size = len(enc_data),
-                read_data = enc_data)
+                read_data = enc_data,
+                request_id = self.request_id,
+                addresses = self.addresses,
+                samples = self.samples,
+                expired = expired)
                 
-            self.handler.send_answer(raw)
+            self.handler.send_answer(raw,self.route)
+            
+        def expire(self):
+            '''The request was dropped at its deadline, tell the client if it asked for it'''
+            if self.expired: self.answer_raw('',error_flag=1,expired=1)
             
         def _encode_payload(self,addr,value):
             
-            if fpga_map.REGISTER_TYPE[addr] == 'str':
-                lstr = len(value)
-                value = value + 'X'*(-lstr%4)
-                return struct.pack('I',lstr) + value
+            if self.addresses is not None:
+                if value == '': return ''
+                return reg_codec.list_codec(self.addresses).encode(value)
+            
+            elif fpga_map.REGISTER_TYPE[addr] == 'str':
+                return reg_codec.encode_str(value)
                 
             elif type(value) is list:
-                raw = [self._encode_reg(a,v) for a,v in zip(range(addr,addr+len(value)),value)]
-                return ''.join(raw)
+                return reg_codec.codec(addr,len(value)).encode(value)
             
             elif value == '': return ''
             
-            else : return self._encode_reg(addr,value)
+            else : return reg_codec.codec(addr,1).encode([value])
             
-        def _encode_reg(self,addr,value):
-            return struct.pack(fpga_map.REGISTER_TYPE[addr],value)
+    def get_request(self,block=True):
         
-    def get_request(self):
+        if not block: timeout = 0
+        elif self.timeout == -1: timeout = None
+        else: timeout = self.timeout
+        events = dict(self.poller.poll(timeout))
         
-        message = self.socket_request.recv()
+        if self.socket_router in events:
+            route, message = self.socket_router.recv_multipart()
+        elif self.socket_request in events:
+            route, message = None, self.socket_request.recv()
+        else:
+            raise zmq.ZMQError(zmq.EAGAIN)
         
-        pck = FPGAServerInterface.Request(self)
+        pck = FPGAServerInterface.Request(self,route)
         pck.decode(message)
         
         return pck
         
-    def send_answer(self,raw):
-        self.socket_answer.send(raw)
+    def poll(self,timeout):
+        '''Wait up to timeout ms for a request, returns True if one is waiting'''
+        return bool(self.poller.poll(timeout))
+        
+    def send_answer(self,raw,route=None):
+        if route is None: self.socket_answer.send(raw)
+        else: self.socket_router.send_multipart([route, raw])
+        
+    def publish(self,raw):
+        self.socket_stream.send(raw)
        
 
 # =========================== Test and example ===========================
@@ -214,10 +214,56 @@ class PATStatusPacket(IpcPacket):
 
         return self.return_addr, self.status_flag
 
+# Optional fields of the FPGA map packets, flagged in the rw_flag byte above the read/write and error bits.
+# Present fields follow the 12 bytes header, in this order, before the payload.
+# A format ending with '*' is a list: 'H' count, then count items.
+FPGA_MAP_EXT_ID   = 0x04 # 32 bits request identifier, echoed in the answer
+FPGA_MAP_EXT_LIST = 0x08 # scatter-gather address list, replaces the start_addr/size range
+FPGA_MAP_EXT_SAMPLES = 0x10 # oversampled read: samples per register, answered with 'ffff' mean, min, max, std per register
+FPGA_MAP_EXT_DEADLINE = 0x20 # unix time after which the server drops the request instead of serving it
+FPGA_MAP_EXT_EXPIRED = 0x40 # request: 1 to be answered if dropped at its deadline, answer: 1 if it was
+FPGA_MAP_EXT_UNCACHED = 0x80 # 1 to read the config registers from the FPGA, not from the server shadow cache
+FPGA_MAP_EXTENSIONS = [
+    (FPGA_MAP_EXT_ID, 'request_id', 'I'),
+    (FPGA_MAP_EXT_LIST, 'addresses', 'H*'),
+    (FPGA_MAP_EXT_SAMPLES, 'samples', 'H'),
+    (FPGA_MAP_EXT_DEADLINE, 'deadline', 'd'),
+    (FPGA_MAP_EXT_EXPIRED, 'expired', 'B'),
+    (FPGA_MAP_EXT_UNCACHED, 'uncached', 'B')]
+
+def _encode_extensions(pck):
+    '''returns the flags and bytes of the optional fields set on the packet'''
+    flags = 0
+    raw = ''
+    for flag, name, frmt in FPGA_MAP_EXTENSIONS:
+        value = getattr(pck, name, None)
+        if value is not None:
+            flags |= flag
+            if frmt[-1] == '*': raw += struct.pack('H%d%s'%(len(value),frmt[:-1]), len(value), *value)
+            else:               raw += struct.pack(frmt, value)
+    return flags, raw
+
+def _decode_extensions(pck, flags, raw):
+    '''set the optional fields flagged on the packet, None if absent
+    returns the bytes following them'''
+    offset = 0
+    for flag, name, frmt in FPGA_MAP_EXTENSIONS:
+        if flags & flag and frmt[-1] == '*':
+            count = struct.unpack_from('H', raw, offset)[0]
+            item_frmt = '%d%s' % (count, frmt[:-1])
+            setattr(pck, name, list(struct.unpack_from(item_frmt, raw, offset+2)))
+            offset += 2 + struct.calcsize(item_frmt)
+        elif flags & flag:
+            setattr(pck, name, struct.unpack_from(frmt, raw, offset)[0])
+            offset += struct.calcsize(frmt)
+        else:
+            setattr(pck, name, None)
+    return raw[offset:]
+
 class FPGAMapRequestPacket(IpcPacket):
     def __init__(self): IpcPacket.__init__(self)
 
-    def encode(self, return_addr, rq_number, rw_flag, start_addr, size=0, write_data=''):
+    def encode(self, return_addr, rq_number, rw_flag, start_addr, size=0, write_data='', request_id=None, addresses=None, samples=None, deadline=None, expired=None, uncached=None):
         '''Encode a request to the FPGA memory map
         return_addr: unique identifier for return message, can be PID
         request_number: will be sent back with the answer, can be used to identify individual requests
@@ -225,6 +271,12 @@ class FPGAMapRequestPacket(IpcPacket):
         start_addr: first FPGA register to read or write
         size: number of 32bit registers to read
         write_data: data to be written
+        request_id: optional 32 bits identifier, will be sent back with the answer
+        addresses: optional list of registers to read or write instead of the range from start_addr
+        samples: optional number of readings of each register, answered with their statistics
+        deadline: optional unix time, the request is dropped if it has not been served by then
+        expired: 1 to get an answer, with the error flag, when the request is dropped at its deadline
+        uncached: 1 to read the registers from the FPGA even if the server has them cached, to verify a write
         returns
         message bytes'''
 
@@ -235,13 +287,21 @@ class FPGAMapRequestPacket(IpcPacket):
         self.size = size
         self.write_data = write_data
         self.write_size = len(write_data)
+        self.request_id = request_id
+        self.addresses = addresses
+        self.samples = samples
+        self.deadline = deadline
+        self.expired = expired
+        self.uncached = uncached
+        
+        flags, extensions = _encode_extensions(self)
 
         if self.rw_flag == 0:
             #Reading
             if options.CHECK_ASSERTS:
                 assert self.write_size == 0
 
-            self.raw = struct.pack('IBBHI',return_addr,rq_number,rw_flag,start_addr,size)
+            self.raw = struct.pack('IBBHI',return_addr,rq_number,rw_flag | flags,start_addr,size) + extensions
 
         elif self.rw_flag == 1:
             #Writing
@@ -249,7 +309,7 @@ class FPGAMapRequestPacket(IpcPacket):
                 assert (self.write_size % 4) == 0
                 assert self.write_size == size
 
-            self.raw = struct.pack('IBBHI%ds'%size,return_addr,rq_number,rw_flag,start_addr,size,write_data)
+            self.raw = struct.pack('IBBHI',return_addr,rq_number,rw_flag | flags,start_addr,size) + extensions + write_data
 
         else:
             raise
@@ -268,9 +328,11 @@ class FPGAMapRequestPacket(IpcPacket):
         write_data: data to be written'''
 
         self.raw = raw
-        raw_size = len(raw)-12
 
-        self.return_addr, self.rq_number, self.rw_flag, self.start_addr, self.size, self.write_data = struct.unpack('IBBHI%ds'%raw_size,raw)
+        self.return_addr, self.rq_number, flags, self.start_addr, self.size = struct.unpack('IBBHI',raw[:12])
+        self.write_data = _decode_extensions(self, flags, raw[12:])
+        self.rw_flag = flags & 0x01
+        raw_size = len(self.write_data)
 
         if self.rw_flag == 0:
             #Reading
@@ -290,6 +352,10 @@ class FPGAMapRequestPacket(IpcPacket):
         return self.return_addr, self.rq_number, self.rw_flag, self.start_addr, self.size, self.write_data #, self.decoded_data
 
     def __str__(self):
+        if self.addresses is not None:
+            return 'IPC FPGA_MAP_REQUEST_PACKET, PID:%d, request number:%d, %s registers:%s' % (self.return_addr, self.rq_number, ['Reading','Writing'][self.rw_flag], self.addresses)
+        if self.samples is not None:
+            return 'IPC FPGA_MAP_REQUEST_PACKET, PID:%d, request number:%d, Oversampling %d registers from address:0x%04X, %d samples' % (self.return_addr, self.rq_number, self.size//4, self.start_addr, self.samples)
         if self.rw_flag == 0:
             return 'IPC FPGA_MAP_REQUEST_PACKET, PID:%d, request number:%d, Reading %d registers from address:0x%04X' % (self.return_addr, self.rq_number, self.size, self.start_addr)
         elif self.rw_flag == 1:
@@ -299,7 +365,7 @@ class FPGAMapRequestPacket(IpcPacket):
 class FPGAMapAnswerPacket(IpcPacket):
     def __init__(self): IpcPacket.__init__(self)
 
-    def encode(self, return_addr, rq_number, rw_flag, error_flag, start_addr, size=0, read_data=''):
+    def encode(self, return_addr, rq_number, rw_flag, error_flag, start_addr, size=0, read_data='', request_id=None, addresses=None, samples=None, expired=None):
         '''Encode a request to the FPGA memory map
         return_addr: unique identifier for return message, can be PID
         request_number: will be sent back with the answer, can be used to identify individual requests
@@ -307,6 +373,10 @@ class FPGAMapAnswerPacket(IpcPacket):
         start_addr: first FPGA register to read or write
         size: number of 32bit registers that have been read/written
         read_data: data to be written
+        request_id: optional 32 bits identifier of the request
+        addresses: address list of a scatter-gather request, read_data follows its order
+        samples: readings per register of an oversampled request, read_data holds their statistics
+        expired: 1 if the request was dropped at its deadline
         returns
         message bytes'''
 
@@ -314,7 +384,12 @@ class FPGAMapAnswerPacket(IpcPacket):
         self.rq_number = rq_number
         self.rw_flag = rw_flag
         self.error_flag = error_flag
-        combined_flag = (rw_flag & 0x01) + (error_flag << 1 & 0x02)
+        self.request_id = request_id
+        self.addresses = addresses
+        self.samples = samples
+        self.expired = expired
+        flags, extensions = _encode_extensions(self)
+        combined_flag = (rw_flag & 0x01) + (error_flag << 1 & 0x02) + flags
         self.start_addr = start_addr
         self.size = size
         self.read_data = read_data
@@ -325,7 +400,7 @@ class FPGAMapAnswerPacket(IpcPacket):
         if options.CHECK_ASSERTS:
             assert (self.read_size % 4) == 0
 
-        self.raw = struct.pack('IBBHI%ds'%self.read_size,return_addr,rq_number,combined_flag,start_addr,size,read_data)
+        self.raw = struct.pack('IBBHI',return_addr,rq_number,combined_flag,start_addr,size) + extensions + read_data
 
         return self.raw
 
@@ -341,9 +416,10 @@ class FPGAMapAnswerPacket(IpcPacket):
         write_data: data to be written'''
 
         self.raw = raw
-        raw_size = len(raw)-12
 
-        self.return_addr, self.rq_number, flags, self.start_addr, self.size, self.read_data = struct.unpack('IBBHI%ds'%raw_size,raw)
+        self.return_addr, self.rq_number, flags, self.start_addr, self.size = struct.unpack('IBBHI',raw[:12])
+        self.read_data = _decode_extensions(self, flags, raw[12:])
+        raw_size = len(self.read_data)
 
         self.rw_flag = flags & 0x01
         self.error = (flags & 0x02) >> 1
@@ -362,6 +438,328 @@ class FPGAMapAnswerPacket(IpcPacket):
         elif self.rw_flag == 1:
             return 'IPC FPGA_MAP_ANSWER_PACKET, PID:%d, request number:%d, Write to address:0x%04X, %s' % (self.return_addr, self.rq_number, self.start_addr, status_str)
 
+class FPGAStreamSubscribePacket(IpcPacket):
+    def __init__(self): IpcPacket.__init__(self)
+
+    def encode(self, period_ms, addresses):
+        '''Encode a register stream subscription, written to STREAM_SUBSCRIBE
+        period_ms: sampling period in milliseconds
+        addresses: registers sampled together, raw or virtual
+        returns
+        message bytes'''
+
+        self.period_ms = period_ms
+        self.addresses = list(addresses)
+        self.count = len(self.addresses)
+
+        self.raw = struct.pack('II%dI'%self.count,period_ms,self.count,*self.addresses)
+
+        return self.raw
+
+    def decode(self, raw):
+        self.raw = raw
+
+        self.period_ms, self.count = struct.unpack('II',raw[:8])
+        self.addresses = list(struct.unpack('%dI'%self.count,raw[8:8+4*self.count]))
+
+        return self.period_ms, self.addresses
+
+    def __str__(self):
+        return 'IPC FPGA_STREAM_SUBSCRIBE_PACKET, period:%d ms, addresses:%s' % (self.period_ms, self.addresses)
+
+class FPGAStreamFramePacket(IpcPacket):
+    def __init__(self): IpcPacket.__init__(self)
+
+    def encode(self, stream_id, timestamp, read_data=''):
+        '''Encode one sample of a register stream
+        stream_id: stream identifier, the first 4 bytes are the topic subscribers filter on
+        timestamp: sampling time, seconds since the epoch
+        read_data: register values, encoded as their REGISTER_TYPE
+        returns
+        message bytes'''
+
+        self.stream_id = stream_id
+        self.timestamp = timestamp
+        self.read_data = read_data
+        self.size = len(read_data)
+
+        self.raw = struct.pack('Id%ds'%self.size,stream_id,timestamp,read_data)
+
+        return self.raw
+
+    def decode(self, raw):
+        self.raw = raw
+        raw_size = len(raw)-16
+
+        self.stream_id, self.timestamp, self.read_data = struct.unpack('Id%ds'%raw_size,raw)
+        self.size = raw_size
+
+        return self.stream_id, self.timestamp, self.read_data
+
+    def __str__(self):
+        return 'IPC FPGA_STREAM_FRAME_PACKET, stream:%d, time:%f, data:%s' % (self.stream_id, self.timestamp, binascii.hexlify(self.read_data))
+
+# Register macro operations, executed in order by the FPGA server.
+# Each operation is (opcode, addr, operand); the engine keeps the last value read
+# and a compare mask, 0xFFFFFFFF until set by MACRO_MASK.
+MACRO_READ      = 1  # read addr, capture its value
+MACRO_WRITE     = 2  # write operand to addr
+MACRO_SET       = 3  # read addr, write it back with the operand bits set
+MACRO_CLEAR     = 4  # read addr, write it back with the operand bits cleared
+MACRO_MASK      = 5  # compare mask of the next verify and branches
+MACRO_VERIFY    = 6  # read addr, capture its value, fail if it does not match the operand
+MACRO_BRANCH_EQ = 7  # jump to operation addr if the last value read matches the operand
+MACRO_BRANCH_NE = 8  # jump to operation addr if the last value read does not match the operand
+MACRO_WAIT      = 9  # wait operand milliseconds
+MACRO_LOOP      = 10 # jump back to operation addr, until the loop body ran operand times
+
+class FPGAMacroPacket(IpcPacket):
+    def __init__(self): IpcPacket.__init__(self)
+
+    def encode(self, operations):
+        '''Encode a register macro, written to MACRO
+        operations: list of (opcode, addr, operand)
+        returns
+        message bytes'''
+
+        self.operations = list(operations)
+        self.count = len(self.operations)
+
+        flat = [field for operation in self.operations for field in operation]
+        self.raw = struct.pack('I'+'BxHI'*self.count,self.count,*flat)
+
+        return self.raw
+
+    def decode(self, raw):
+        self.raw = raw
+
+        self.count = struct.unpack('I',raw[:4])[0]
+        flat = struct.unpack('BxHI'*self.count,raw[4:4+8*self.count])
+        self.operations = [flat[idx:idx+3] for idx in range(0, len(flat), 3)]
+
+        return self.operations
+
+    def __str__(self):
+        return 'IPC FPGA_MACRO_PACKET, operations:%s' % self.operations
+
+class FPGAMacroResultPacket(IpcPacket):
+    def __init__(self): IpcPacket.__init__(self)
+
+    def encode(self, addresses, read_data=''):
+        '''Encode the values captured by a register macro
+        addresses: register of each captured value, in capture order
+        read_data: captured values, encoded as their REGISTER_TYPE
+        returns
+        message bytes'''
+
+        self.addresses = list(addresses)
+        self.count = len(self.addresses)
+        self.read_data = read_data
+
+        self.raw = struct.pack('I%dI'%self.count,self.count,*self.addresses) + read_data
+
+        return self.raw
+
+    def decode(self, raw):
+        self.raw = raw
+
+        self.count = struct.unpack('I',raw[:4])[0]
+        self.addresses = list(struct.unpack('%dI'%self.count,raw[4:4+4*self.count]))
+        self.read_data = raw[4+4*self.count:]
+
+        return self.addresses, self.read_data
+
+    def __str__(self):
+        return 'IPC FPGA_MACRO_RESULT_PACKET, addresses:%s' % self.addresses
+
+class FPGAWaitPacket(IpcPacket):
+    def __init__(self): IpcPacket.__init__(self)
+
+    def encode(self, addr, mask, value, period_us, timeout_ms):
+        '''Encode a wait for condition, written to WAIT_COND
+        addr: register polled by the server, raw or virtual
+        mask, value: the wait ends when register & mask == value
+        period_us: polling period in microseconds
+        timeout_ms: the wait gives up after that many milliseconds
+        returns
+        message bytes'''
+
+        self.addr = addr
+        self.mask = mask
+        self.value = value
+        self.period_us = period_us
+        self.timeout_ms = timeout_ms
+
+        self.raw = struct.pack('IIIII',addr,mask,value,period_us,timeout_ms)
+
+        return self.raw
+
+    def decode(self, raw):
+        self.raw = raw
+
+        self.addr, self.mask, self.value, self.period_us, self.timeout_ms = struct.unpack('IIIII',raw[:20])
+
+        return self.addr, self.mask, self.value, self.period_us, self.timeout_ms
+
+    def __str__(self):
+        return 'IPC FPGA_WAIT_PACKET, address:0x%04X & 0x%X == 0x%X, period:%d us, timeout:%d ms' % (self.addr, self.mask, self.value, self.period_us, self.timeout_ms)
+
+class FPGAWaitResultPacket(IpcPacket):
+    def __init__(self): IpcPacket.__init__(self)
+
+    def encode(self, matched, elapsed, read_data=''):
+        '''Encode the outcome of a wait for condition
+        matched: 1 if the condition was met, 0 on timeout
+        elapsed: seconds from the first to the last poll
+        read_data: last value read, encoded as its REGISTER_TYPE
+        returns
+        message bytes'''
+
+        self.matched = matched
+        self.elapsed = elapsed
+        self.read_data = read_data
+        self.size = len(read_data)
+
+        self.raw = struct.pack('Id%ds'%self.size,matched,elapsed,read_data)
+
+        return self.raw
+
+    def decode(self, raw):
+        self.raw = raw
+        raw_size = len(raw)-16
+
+        self.matched, self.elapsed, self.read_data = struct.unpack('Id%ds'%raw_size,raw)
+        self.size = raw_size
+
+        return self.matched, self.elapsed, self.read_data
+
+    def __str__(self):
+        return 'IPC FPGA_WAIT_RESULT_PACKET, matched:%d, elapsed:%f s' % (self.matched, self.elapsed)
+
+class FPGAAlignPacket(IpcPacket):
+    def __init__(self): IpcPacket.__init__(self)
+
+    def encode(self, center, window, band_low=0.0, band_high=0.0):
+        '''Encode a seed laser alignment scan, written to SEED_ALIGN
+        center: TEC setpoint, LTSa*256 + LTSb, at the middle of the scan
+        window: setpoints scanned on each side of center
+        band_low, band_high: EDFA input power band to land in, dBm. The maximum power is searched if band_low >= band_high
+        returns
+        message bytes'''
+
+        self.center = center
+        self.window = window
+        self.band_low = band_low
+        self.band_high = band_high
+
+        self.raw = struct.pack('IIff',center,window,band_low,band_high)
+
+        return self.raw
+
+    def decode(self, raw):
+        self.raw = raw
+
+        self.center, self.window, self.band_low, self.band_high = struct.unpack('IIff',raw[:16])
+
+        return self.center, self.window, self.band_low, self.band_high
+
+    def __str__(self):
+        return 'IPC FPGA_ALIGN_PACKET, center:%d, window:%d, band:[%f, %f] dBm' % (self.center, self.window, self.band_low, self.band_high)
+
+class FPGAAlignResultPacket(IpcPacket):
+    def __init__(self): IpcPacket.__init__(self)
+
+    def encode(self, matched, setpoint, curve):
+        '''Encode the outcome of a seed laser alignment scan
+        matched: 1 if setpoint is in the power band, or the maximum when no band was given
+        setpoint: TEC setpoint left applied by the scan
+        curve: list of (setpoint, EDFA input power in dBm) measured, in setpoint order
+        returns
+        message bytes'''
+
+        self.matched = matched
+        self.setpoint = setpoint
+        self.curve = list(curve)
+        self.count = len(self.curve)
+
+        flat = [field for point in self.curve for field in point]
+        self.raw = struct.pack('III'+'If'*self.count,matched,setpoint,self.count,*flat)
+
+        return self.raw
+
+    def decode(self, raw):
+        self.raw = raw
+
+        self.matched, self.setpoint, self.count = struct.unpack('III',raw[:12])
+        flat = struct.unpack('If'*self.count,raw[12:12+8*self.count])
+        self.curve = zip(flat[0::2], flat[1::2])
+
+        return self.matched, self.setpoint, self.curve
+
+    def __str__(self):
+        return 'IPC FPGA_ALIGN_RESULT_PACKET, matched:%d, setpoint:%d, curve:%s' % (self.matched, self.setpoint, self.curve)
+
+class FPGABistSweepPacket(IpcPacket):
+    def __init__(self): IpcPacket.__init__(self)
+
+    def encode(self, start, stop, step, repeats=1):
+        '''Encode a BIST threshold sweep, written to BIST_SWEEP
+        start, stop, step: thresholds applied to DAC_1 A-C, as xrange(start, stop, step)
+        repeats: captures per threshold
+        returns
+        message bytes'''
+
+        self.start = start
+        self.stop = stop
+        self.step = step
+        self.repeats = repeats
+
+        self.raw = struct.pack('IIII',start,stop,step,repeats)
+
+        return self.raw
+
+    def decode(self, raw):
+        self.raw = raw
+
+        self.start, self.stop, self.step, self.repeats = struct.unpack('IIII',raw[:16])
+
+        return self.start, self.stop, self.step, self.repeats
+
+    def __str__(self):
+        return 'IPC FPGA_BIST_SWEEP_PACKET, thresholds:%d to %d by %d, repeats:%d' % (self.start, self.stop, self.step, self.repeats)
+
+class FPGABistSweepResultPacket(IpcPacket):
+    def __init__(self): IpcPacket.__init__(self)
+
+    def encode(self, thresholds, repeats, counts):
+        '''Encode the counts of a BIST threshold sweep
+        thresholds: number of thresholds swept
+        repeats: captures per threshold
+        counts: (total, A, B, C) of each capture, threshold after threshold
+        returns
+        message bytes'''
+
+        self.thresholds = thresholds
+        self.repeats = repeats
+        self.counts = list(counts)
+
+        flat = [count for capture in self.counts for count in capture]
+        self.raw = struct.pack('II%dH'%len(flat),thresholds,repeats,*flat)
+
+        return self.raw
+
+    def decode(self, raw):
+        self.raw = raw
+
+        self.thresholds, self.repeats = struct.unpack('II',raw[:8])
+        flat = struct.unpack('%dH'%(4*self.thresholds*self.repeats),raw[8:8+8*self.thresholds*self.repeats])
+        self.counts = [flat[idx:idx+4] for idx in range(0, len(flat), 4)]
+
+        return self.thresholds, self.repeats, self.counts
+
+    def __str__(self):
+        return 'IPC FPGA_BIST_SWEEP_RESULT_PACKET, thresholds:%d, repeats:%d' % (self.thresholds, self.repeats)
+
 class HKControlPacket(IpcPacket):
     def __init__(self): IpcPacket.__init__(self)
 
@@ -480,6 +878,16 @@ if __name__ == '__main__':
     ipc_fpgarqpacket_write.decode(raw)
     print(ipc_fpgarqpacket_write)
 
+    ipc_fpgarqpacket_list = FPGAMapRequestPacket()
+    raw = ipc_fpgarqpacket_list.encode(return_addr=456, rq_number=124, rw_flag=0, start_addr=0x0001, size=12, request_id=1, addresses=[1, 0x20, 0x200])
+    ipc_fpgarqpacket_list.decode(raw)
+    print(ipc_fpgarqpacket_list)
+
+    ipc_fpgarqpacket_samples = FPGAMapRequestPacket()
+    raw = ipc_fpgarqpacket_samples.encode(return_addr=456, rq_number=125, rw_flag=0, start_addr=0x0100, size=4, request_id=2, samples=64)
+    ipc_fpgarqpacket_samples.decode(raw)
+    print(ipc_fpgarqpacket_samples)
+
     ipc_fpgaaswpacket_read = FPGAMapAnswerPacket()
     raw = ipc_fpgaaswpacket_read.encode(return_addr=101112, rq_number=123, rw_flag=0, error_flag=1, start_addr=0x9ABC, size=24, read_data=b"Je! s'appelle! GROOT!!!!")
     ipc_fpgaaswpacket_read.decode(raw)
@@ -490,6 +898,21 @@ if __name__ == '__main__':
     ipc_fpgaaswpacket_write.decode(raw)
     print(ipc_fpgaaswpacket_write)
 
+    ipc_fpgasubscribepacket = FPGAStreamSubscribePacket()
+    raw = ipc_fpgasubscribepacket.encode(period_ms=100, addresses=[200, 201, 202])
+    ipc_fpgasubscribepacket.decode(raw)
+    print(ipc_fpgasubscribepacket)
+
+    ipc_fpgaframepacket = FPGAStreamFramePacket()
+    raw = ipc_fpgaframepacket.encode(stream_id=1, timestamp=1234.5, read_data=b"Je s'appelle Groot!!")
+    ipc_fpgaframepacket.decode(raw)
+    print(ipc_fpgaframepacket)
+
+    ipc_fpgamacropacket = FPGAMacroPacket()
+    raw = ipc_fpgamacropacket.encode([(MACRO_READ, 0x20, 0), (MACRO_SET, 0x20, 0x08), (MACRO_WAIT, 0, 100)])
+    ipc_fpgamacropacket.decode(raw)
+    print(ipc_fpgamacropacket)
+
     empty_ipc_hkcontrolpacket = HKControlPacket()
     raw = empty_ipc_hkcontrolpacket.encode(origin=0x01, command=0x07, payload=b"Je s'appelle Groot")
     empty_ipc_hkcontrolpacket.decode(raw)
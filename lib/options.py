@@ -3,6 +3,7 @@ CHECK_ASSERTS = 1
 
 COMMAND_HANDLERS_COUNT = 3
 MESSAGE_TIMEOUT = 5000 # wait 5 seconds for ZeroMQ response
+FPGA_MAX_IN_FLIGHT = 128 # requests a FPGA client can have waiting for an answer
 
 # File management
 SYMLINK_MAX = 10
@@ -45,6 +46,9 @@ HK_CONTROL_PORT = "5556"
 
 FPGA_MAP_ANSWER_PORT = "5557"
 FPGA_MAP_REQUEST_PORT = "5558"
+FPGA_MAP_STREAM_PORT = "5567"
+FPGA_MAP_ENDPOINT = "ipc:///tmp/fpga_map" # ROUTER socket of the FPGA server
+FPGA_MAP_USES_ROUTER = 1 # Python clients use a DEALER socket on FPGA_MAP_ENDPOINT, 0 for the TCP PUB/SUB ports PAT uses
 
 PAT_HEALTH_PORT = "5559"
 PAT_CONTROL_PORT = "5560"
@@ -59,15 +63,51 @@ LB_HEARTBEAT_PORT = "5566"
 
 #FPGA interface
 IPC_USES_SPI = 1
+IPC_USES_SIM = 0 # simulated FPGA, for running the IPC stack without hardware
 FPGA_SHELL_USES_IPC = 0
 FPGA_SHELL_USES_SPI = 1
 
 SPI_FREQ = 1000000
+SPI_MAX_XFER = 4096 # bytes, spidev bufsiz
 USB_DEVICE_ID = "1d50:602b:0002"
+SIM_LATENCY = 0.0001 # seconds added to every simulated SPI transfer
+SIM_SYMBOL_RATE = 100000 # symbols per second drained from the simulated modulator FIFO
 
 EDFA_READ_WRITE_DELAY = 0.1
 EDFA_TIMOUT = 1.0
-EDFA_VIRTUAL_REGS_GOOD_FOR = 0.5
+EDFA_POLL_PD = 0.01 # seconds between EDFA UART reads while waiting for a command reply
+EDFA_SAMPLE_PD = 0.5 # seconds, period of the background EDFA status refresh
+EDFA_SAMPLE_IDLE = 0.05 # seconds without FPGA requests before the background EDFA refresh uses the bus
+EDFA_SAMPLE_MAX_AGE = 5.0 # seconds, the EDFA status is refreshed anyway once that old, even under load
+REG_CACHE_GOOD_FOR = 60 # seconds, config registers are re-read from the FPGA after that
+REG_CODEC_CACHE_SIZE = 256 # register block codecs kept by reg_codec, per cache, least recently used dropped first
+SENSOR_CALIBRATION_FILE = '/root/lib/sensorCalibration.csv' # per channel temperature/current calibration
+SENSOR_CALIBRATION_CHECK_PD = 5 # seconds between checks for an updated calibration file
+STREAM_LEASE = 60 # seconds, a register stream subscription ends if not renewed within that time
+STREAM_MIN_PERIOD = 0.01 # seconds, fastest register stream sampling
+MOD_FIFO_DEPTH = 2048 # symbols held by the modulator data FIFO, as sized by the FPGA driver
+MOD_FIFO_BURST = 1024 # symbols written per SPI transfer
+MOD_FIFO_POLL_PD = 0.001 # seconds between fill reads while the modulator FIFO is full
+MOD_FIFO_TIMEOUT = 1.0 # seconds, give up on a symbol buffer if the FIFO stays full that long
+MACRO_MAX_STEPS = 10000 # operations a register macro can execute, loops included
+MACRO_MAX_WAIT = 5.0 # seconds, longest wait of a register macro operation
+WAIT_COND_MIN_PERIOD = 0.0001 # seconds, fastest polling of a wait for condition
+WAIT_COND_MAX_TIMEOUT = 10.0 # seconds, longest wait for condition
+ALIGN_COARSE_STEP = 4 # TEC setpoints between points of the first alignment pass, halved on each refining pass
+ALIGN_AVERAGE = 3 # EDFA input power readings averaged per alignment point
+ALIGN_SETTLE_PD = 0.02 # seconds between TEC readbacks while waiting for it to settle
+ALIGN_SETTLE_TOL = 2 # TEC readback codes, settled when the readback stays within that range for ALIGN_SETTLE_WINDOW
+ALIGN_SETTLE_WINDOW = 0.5 # seconds of stable TEC readback before a point is measured
+ALIGN_SETTLE_TIMEOUT = 3.0 # seconds, the point is measured anyway after that
+BIST_POLL_PD = 0.0005 # seconds between BIST capture done polls during a threshold sweep
+BIST_SETTLE = 0.001 # seconds between setting the BIST thresholds and starting the capture
+BIST_CAPTURE_TIMEOUT = 1.0 # seconds, a BIST capture fails if it takes longer, in a sweep or point by point
+BIST_MAX_CAPTURES = 8192 # captures of one threshold sweep, thresholds times repeats
+OVERSAMPLE_MAX = 1024 # readings per register of one oversampled request
+OVERSAMPLE_PD = 0.001 # seconds between the readings of an oversampled request, each one is a new ADC conversion
+MERGE_READS = 1 # serve the queued reads together, each register read once for all of them
+MERGE_MAX_REGS = 256 # distinct registers of one merged read
+SCHED_STARVATION_LIMIT = 0.5 # seconds, FPGA requests waiting longer are served regardless of priority
 
 #Time at tone packet APID
 APID_TIME_AT_TONE = 0x280
@@ -217,6 +257,8 @@ FL_SUCCESS = 0xFF
 # Set Time Flag
 TIME_SET_ENABLE = 0
 
+FPGA_TELEM_PD = 1 # seconds, refresh period of the telemetry snapshot in the FPGA server
+FPGA_TELEM_CHUNK = 16 # registers read per server loop iteration while refreshing the snapshot
 FPGA_TELEM_REGS = sum([range(0,5), range(32,39), range(47,49), range(53,55), [57], range(60,64), range(96,98), range(200,206), range(300,304), range(602,612), range(502,510)],[])
 #FPGA_TELEM_REGS = sum([range(602,612)],[])
 # For housekeeping/commandhandler interface
@@ -231,6 +273,7 @@ HK_CONTROL_CH = 0x03
 ERR_HK_RESTART = 0x380 #Change
 ERR_FL_FILE_INVALID = 0x381 #Change
 ERR_DPKT_CRC_INVALID = 0x382 #Change
+ERR_SENSOR_CALIB_INVALID = 0x383 #Change
 ERR_GEN_EXCEPTION = 0x387
 
 RAISE_ENABLE = 1
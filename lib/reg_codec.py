@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+import struct
+import collections
+import threading
+import options
+import fpga_map
+
+# Payload encoding of register blocks.
+# One struct.Struct is compiled per (start_addr, count) the first time the block is used,
+# whole blocks are then packed and unpacked in a single call.
+# At most REG_CODEC_CACHE_SIZE codecs are kept per cache, the least recently used is dropped first.
+# The caches are shared by every thread of the process, they are only used under _lock.
+# Registers typed 'xxxx' carry no value: decoded as 0, skipped on encode.
+
+class BlockCodec:
+    def __init__(self, addresses):
+        types = [fpga_map.REGISTER_TYPE[addr] for addr in addresses]
+        self.struct = struct.Struct(''.join(types))
+        self.size = self.struct.size
+        self.valued = [frmt != 'xxxx' for frmt in types]
+        self.full = all(self.valued)
+
+    def decode(self, raw, offset=0):
+        '''returns the list of register values, one per register of the block'''
+        values = self.struct.unpack_from(raw, offset)
+        if self.full: return list(values)
+        values = iter(values)
+        return [next(values) if valued else 0 for valued in self.valued]
+
+    def encode(self, values):
+        if not self.full:
+            values = [value for value, valued in zip(values, self.valued) if valued]
+        return self.struct.pack(*values)
+
+_lock = threading.Lock()
+def _cached(cache, key, addresses):
+    with _lock:
+        block = cache.pop(key, None)
+        if block is None:
+            block = BlockCodec(addresses)
+            if len(cache) >= options.REG_CODEC_CACHE_SIZE: cache.popitem(last=False)
+        cache[key] = block
+    return block
+
+_codecs = collections.OrderedDict()
+def codec(start_addr, count):
+    '''returns the BlockCodec of count registers from start_addr'''
+    return _cached(_codecs, (start_addr, count), xrange(start_addr, start_addr+count))
+
+_list_codecs = collections.OrderedDict()
+def list_codec(addresses):
+    '''returns the BlockCodec of an arbitrary list of registers'''
+    key = tuple(addresses)
+    return _cached(_list_codecs, key, key)
+
+def encode_str(value):
+    '''str registers: length as 'I', then the string padded to a multiple of 4'''
+    lstr = len(value)
+    return struct.pack('I',lstr) + value + 'X'*(-lstr%4)
+
+def decode_str(raw):
+    lstr = struct.unpack_from('I',raw)[0]
+    return raw[4:lstr+4]
+
+def encode_stats(stats):
+    '''Oversampled registers: mean, min, max, std as 'ffff' per register'''
+    flat = [value for register in stats for value in register]
+    return struct.pack('%df'%len(flat), *flat)
+
+def decode_stats(raw):
+    '''returns the list of (mean, min, max, std), one per register'''
+    flat = struct.unpack('%df'%(len(raw)//4), raw)
+    return [flat[idx:idx+4] for idx in range(0, len(flat), 4)]
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+import sys
+sys.path.append('/root/lib/')
+import os
+import time
+import math
+import struct
+import options
+import fpga_map as mmap
+from ipc_packets import TxPacket
+
+# Conversion of the 12 bit ADC codes of the temperature and current channels.
+# Every code is converted once from the channel calibration, samples are then table lookups.
+#
+# Calibration file, one line per channel: NAME, coefficients
+#  temperature: K, V0, A, C0, C1, R1, D
+#               Rrtd = K/(code - V0), temp = (-A + sqrt(C0 + C1*(R1 - Rrtd))) / D
+#  current:     GAIN, OFFSET
+#               current = GAIN*code + OFFSET
+
+ADC_CODES = 4096
+
+# Same formulas as fpga_map.decode_temperature() and decode_current()
+DEFAULT_TEMPERATURE = (-4.22806*10**4, 22978.6, 3.81e-3, 1.451e-5, 2.408e-6, 1.92, -1.2e-6)
+DEFAULT_CURRENT = (8.05e-4/1.01, 0.0)
+
+def temperature(code, coeffs):
+    K, V0, A, C0, C1, R1, D = coeffs
+    Rrtd = K/(code - V0)
+    return (-A + math.sqrt(C0 + C1*(R1 - Rrtd))) / D
+
+def current(code, coeffs):
+    gain, offset = coeffs
+    return gain*code + offset
+
+def read_calibration(path):
+    '''returns {register: coefficients} from a calibration file
+    raises ValueError naming the first bad line: unknown channel, bad number or wrong number of coefficients'''
+    calib = {}
+    with open(path) as f:
+        for num, line in enumerate(f):
+            fields = [field.strip() for field in line.split(',')]
+            if not fields[0]: continue
+            addr = getattr(mmap, fields[0], None)
+            if addr in mmap.TEMPERATURE_BLOCK: count = len(DEFAULT_TEMPERATURE)
+            elif addr in mmap.CURRENT_BLOCK:   count = len(DEFAULT_CURRENT)
+            else: raise ValueError('%s line %d: unknown channel %s' % (path, num+1, fields[0]))
+            if len(fields) - 1 != count:
+                raise ValueError('%s line %d: %s needs %d coefficients, got %d' % (path, num+1, fields[0], count, len(fields)-1))
+            try: calib[addr] = tuple([float(field) for field in fields[1:]])
+            except ValueError: raise ValueError('%s line %d: bad number in %s' % (path, num+1, line.strip()))
+    return calib
+
+class SensorLUT:
+    '''Conversion tables of the temperature and current channels.
+    Channels missing from the calibration file keep the default formula.
+    The tables are rebuilt when the file changes, see tick(). An invalid file is ignored, the previous tables
+    stay in use, and an ERR_SENSOR_CALIB_INVALID packet is sent on tx_socket if one is given'''
+    def __init__(self, path=options.SENSOR_CALIBRATION_FILE, tx_socket=None):
+        self.path = path
+        self.tx_socket = tx_socket
+        self.mtime = None
+        self.checked = 0
+        self.tables = {}
+        self.channels = {}
+        self.load()
+
+    def load(self):
+        calib = {}
+        if os.path.exists(self.path):
+            self.mtime = os.path.getmtime(self.path)
+            try:
+                calib = read_calibration(self.path)
+            except (IOError, ValueError) as error:
+                self.report(str(error))
+                if self.tables: return
+                calib = {}
+
+        channels = {}
+        for addr in mmap.TEMPERATURE_BLOCK:
+            channels[addr] = (temperature, calib.get(addr, DEFAULT_TEMPERATURE))
+        for addr in mmap.CURRENT_BLOCK:
+            channels[addr] = (current, calib.get(addr, DEFAULT_CURRENT))
+        self.tables = dict([(addr, self._build(*channels[addr])) for addr in channels])
+        self.channels = channels
+
+    def report(self, message):
+        if not self.tx_socket: return
+        message = message[:options.BUS_DATA_LEN-2]
+        pkt_payload = struct.pack('!H%ds' % len(message), len(message), message)
+        self.tx_socket.send(TxPacket().encode(options.ERR_SENSOR_CALIB_INVALID, pkt_payload))
+
+    def _build(self, formula, coeffs):
+        table = []
+        for code in xrange(ADC_CODES):
+            try: table.append(formula(code, coeffs))
+            except (ValueError, ZeroDivisionError): table.append(float('nan'))
+        return table
+
+    def tick(self):
+        '''Reload the calibration if the file changed, checked every SENSOR_CALIBRATION_CHECK_PD'''
+        now = time.time()
+        if now - self.checked < options.SENSOR_CALIBRATION_CHECK_PD: return
+        self.checked = now
+        if os.path.exists(self.path) and os.path.getmtime(self.path) != self.mtime:
+            self.load()
+
+    def convert(self, addr, msb, lsb):
+        return self.convert_vector([addr], [msb], [lsb])[0]
+
+    def convert_vector(self, addresses, msbs, lsbs):
+        '''Convert a whole vector of samples, one channel address per sample'''
+        tables = self.tables
+        values = []
+        for addr, msb, lsb in zip(addresses, msbs, lsbs):
+            code = msb*256 + lsb
+            if code < ADC_CODES:
+                values.append(tables[addr][code])
+            else:
+                # Out of the ADC range, convert directly
+                formula, coeffs = self.channels[addr]
+                values.append(formula(code, coeffs))
+        return values
+
+_default = None
+def default():
+    '''Tables of the default calibration file, built on first use'''
+    global _default
+    if _default is None: _default = SensorLUT()
+    return _default
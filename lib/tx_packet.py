@@ -56,8 +56,8 @@ class txPacket():
     Writes to FPGA FIFO 
     """
     def transmit(self, fpga, sleep_time=1):
-        for i in xrange(len(self.symbols[:])):
-            fpga.write_reg(mmap.DATA, self.symbols[i])
+        # One request for the whole packet, the server streams it into the FIFO
+        fpga.write_reg(mmap.MOD_FIFO, ''.join([chr(symbol) for symbol in self.symbols]))
         time.sleep(sleep_time)
 
 
@@ -86,28 +86,14 @@ def seed_align(default_settings, cw = False):
         fpga.write_reg(mmap.DATA, 131)
     
     time.sleep(2)
-    power_inputs = []
     window = 4
-    avg = 3
-    for i in range(total_tec-window, total_tec+window):
-        tec_msb = i//256
-        tec_lsb = i%256
-        fpga.write_reg(mmap.LTSa, tec_msb)
-        fpga.write_reg(mmap.LTSb, tec_lsb)
-        time.sleep(.1)
-        avg_input_power = sum([fpga.read_reg(mmap.EDFA_POWER_IN) for x in range(avg)])/avg
-        power_inputs.append(avg_input_power)
-
-    pwr_index = None
-    for pwr in power_inputs:
-        if PPM4_THRESHOLDS[0] > pwr > PPM4_THRESHOLDS[1] and not cw:
-            pwr_index = pwr
-        elif CW_THRESHOLDS[0] > pwr > CW_THRESHOLDS[1] and cw:
-            pwr_index = pwr
-
-    if(pwr_index != None):
-	    new_tec = total_tec+power_inputs.index(pwr_index)-window
-    else:
+
+    # TEC scan run by the FPGA server: settles on the TEC readback, lands in the EDFA input power band
+    if(cw): band = (CW_THRESHOLDS[1], CW_THRESHOLDS[0])
+    else:   band = (PPM4_THRESHOLDS[1], PPM4_THRESHOLDS[0])
+    matched, new_tec, curve = fpga.align_seed(total_tec, window, *band)
+
+    if(not matched):
         new_tec = PPM4_THRESHOLDS[0]*256+ PPM4_THRESHOLDS[1]
    
     tec_msb = abs(int(new_tec//256))
@@ -65,10 +65,7 @@ void FSM::setNormalizedAngles(float x, float y)
 		//log(pat_health_port, fileStream,"In fsm.cpp FSM::setNormalizedAngles - Updating FSM position to: ", 
 		//"x_normalized = ", x, " -> voltageBias +/- newX = {", voltageBias + newX, ", ", voltageBias - newX,"}. ",
 		//"y_normalized = ", y, " -> voltageBias +/- newY = {", voltageBias + newY, ", ", voltageBias - newY,"}. ");
-		sendCommand(DAC_CMD_WRITE_INPUT_REG, DAC_ADDR_XP, voltageBias + newX);
-		sendCommand(DAC_CMD_WRITE_INPUT_REG, DAC_ADDR_XM, voltageBias - newX);
-		sendCommand(DAC_CMD_WRITE_INPUT_REG, DAC_ADDR_YP, voltageBias + newY);
-		sendCommand(DAC_CMD_WRITE_INPUT_UPDATE_ALL, DAC_ADDR_YM, voltageBias - newY);
+		fsmWriteSetpoint(voltageBias + newX, voltageBias - newX, voltageBias + newY, voltageBias - newY);
 		oldX = newX;
 		oldY = newY;
 	}
@@ -78,10 +75,7 @@ void FSM::setNormalizedAngles(float x, float y)
 void FSM::forceTransfer()
 //-----------------------------------------------------------------------------
 {
-	sendCommand(DAC_CMD_WRITE_INPUT_REG, DAC_ADDR_XP, voltageBias + oldX);
-	sendCommand(DAC_CMD_WRITE_INPUT_REG, DAC_ADDR_XM, voltageBias - oldX);
-	sendCommand(DAC_CMD_WRITE_INPUT_REG, DAC_ADDR_YP, voltageBias + oldY);
-	sendCommand(DAC_CMD_WRITE_INPUT_UPDATE_ALL, DAC_ADDR_YM, voltageBias - oldY);
+	fsmWriteSetpoint(voltageBias + oldX, voltageBias - oldX, voltageBias + oldY, voltageBias - oldY);
 }
 
 //-----------------------------------------------------------------------------
@@ -143,3 +137,44 @@ void FSM::fsmWrite(uint16_t channel, uint8_t data)
 		}
 	}	
 }
+
+//-----------------------------------------------------------------------------
+//write X+, X-, Y+, Y- to the FSM DAC in one request
+//the FPGA server sends them in one SPI transfer and updates the 4 channels together, with the latest setpoint if several are queued
+void FSM::fsmWriteSetpoint(uint16_t xp, uint16_t xm, uint16_t yp, uint16_t ym)
+//-----------------------------------------------------------------------------
+{
+	uint16_t values[4]; //in DAC address order, from FSM_DAC_CH
+	values[DAC_ADDR_XP] = xp;
+	values[DAC_ADDR_XM] = xm;
+	values[DAC_ADDR_YM] = ym;
+	values[DAC_ADDR_YP] = yp;
+	
+	if(check_fpga_map_value(fpga_map_answer_port, poll_fpga_answer, fpga_map_request_port, (uint16_t) LD_BIAS_CH, (uint8_t) LD_BIAS_ON, fsm_request_number)){
+		// LD Bias is ON -> Send FSM setpoint to FPGA:
+		send_packet_fpga_map_write_block(fpga_map_request_port, fsm_request_number, (uint16_t) FSM_DAC_CH, values, 4);
+		if(!check_fpga_map_write_request(fpga_map_answer_port, poll_fpga_answer, (uint16_t) FSM_DAC_CH, fsm_request_number)){
+			log(pat_health_port, fileStream,"In fsm.cpp FSM::fsmWriteSetpoint - Warning! FSM setpoint write failed!");
+		};
+		fsm_request_number = (fsm_request_number + 1) % 0xFF; //increment request number modulo size(uint8_t)
+
+	} else{
+		// LD bias is OFF (or the read request failed)
+		log(pat_health_port, fileStream, "In fsm.cpp FSM::fsmWriteSetpoint - LD bias ON check did not pass. Commanding LD bias ON...");
+		// Send LD bias ON command to FPGA:
+		send_packet_fpga_map_request(fpga_map_request_port, (bool) WRITE, fsm_request_number, (uint16_t) LD_BIAS_CH, (uint8_t) LD_BIAS_ON);
+
+		// Check that message was received and FPGA was written to:
+		if(check_fpga_map_write_request(fpga_map_answer_port, poll_fpga_answer, (uint16_t) LD_BIAS_CH, fsm_request_number)){
+			// LD Bias is ON -> Send FSM setpoint to FPGA:
+			send_packet_fpga_map_write_block(fpga_map_request_port, fsm_request_number, (uint16_t) FSM_DAC_CH, values, 4);
+			if(!check_fpga_map_write_request(fpga_map_answer_port, poll_fpga_answer, (uint16_t) FSM_DAC_CH, fsm_request_number)){
+				log(pat_health_port, fileStream,"In fsm.cpp FSM::fsmWriteSetpoint - Warning! FSM setpoint write failed!");
+			};
+			fsm_request_number = (fsm_request_number + 1) % 0xFF; //increment request number modulo size(uint8_t)
+			
+		} else{
+			log(pat_health_port, fileStream, "In fsm.cpp FSM::fsmWriteSetpoint - Warning! LD bias ON write failed!");
+		}
+	}	
+}
@@ -21,6 +21,7 @@
 #define FSM_B_CH 0x09 //fsm fpga channel b: voltage 1 (Notated_memory_map on Google Drive)
 #define FSM_C_CH 0x0A //fsm fpga channel c: voltage 2 (Notated_memory_map on Google Drive)
 #define LD_BIAS_CH 0x21 //LD bias channel (Notated_memory_map on Google Drive)
+#define FSM_DAC_CH 0x1FA //DAC_2_A, the 4 FSM DAC channels are written from there in one request (fpga_map.py)
 #define LD_BIAS_ON 0x55 //LD bias ON code (Notated_memory_map on Google Drive)
 #define LD_BIAS_OFF 0x0F //LD bias OFF code (Notated_memory_map on Google Drive)
 #define FSM_VBIAS_DAC 22000
@@ -41,6 +42,7 @@ class FSM
 	void sendCommand(uint8_t cmd, uint8_t addr, uint16_t value);
 	void sendCommand(uint32_t cmd);
 	void fsmWrite(uint16_t channel, uint8_t data);
+	void fsmWriteSetpoint(uint16_t xp, uint16_t xm, uint16_t yp, uint16_t ym);
 public:
 	FSM(std::ofstream &fileStreamIn, zmq::socket_t &pat_health_port_in, zmq::socket_t& fpga_map_request_port_in, zmq::socket_t& fpga_map_answer_port_in, std::vector<zmq::pollitem_t>& poll_fpga_answer_in, uint16_t vBias_dac = FSM_VBIAS_DAC, uint16_t vMax_dac = FSM_VMAX_DAC, float filter = FSM_FILTER);
 	void resetFSM();
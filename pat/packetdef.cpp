@@ -60,6 +60,31 @@ void send_packet_fpga_map_request(zmq::socket_t& fpga_map_request_port, bool rea
 	std::this_thread::sleep_for(std::chrono::milliseconds(1)); //cmd delay 
 }
 
+// Write count 16 bit registers from start_channel in one request
+void send_packet_fpga_map_write_block(zmq::socket_t& fpga_map_request_port, uint8_t request_num, uint16_t start_channel, uint16_t* data, uint8_t count)
+{
+	if(count > FPGA_WRITE_BLOCK_MAX) count = FPGA_WRITE_BLOCK_MAX;
+	
+	fpga_request_write_block_packet_struct packet_struct = fpga_request_write_block_packet_struct();
+	packet_struct.return_address = (uint32_t) getpid(); //get process pid
+	packet_struct.request_number = request_num;
+	packet_struct.read_write_flag = WRITE;
+	packet_struct.start_address = start_channel;
+	for(int i = 0; i < count; i++){
+		packet_struct.data_to_write[4*i+2] = data[i] & 0xFF; //after 2 bytes of pre-padding
+		packet_struct.data_to_write[4*i+3] = (data[i] & 0xFF00) >> 8;
+	}
+	packet_struct.data_size = 4*count;
+	
+	// Only the registers written are sent
+	size_t packet_size = sizeof(packet_struct) - sizeof(packet_struct.data_to_write) + packet_struct.data_size;
+	zmq::message_t message(packet_size);
+	memcpy(message.data(), &packet_struct, packet_size);
+	
+	fpga_map_request_port.send(message);
+	std::this_thread::sleep_for(std::chrono::milliseconds(1)); //cmd delay 
+}
+
 void send_packet_pat_health(zmq::socket_t& pat_health_port, char* data)
 {
 	pat_health_packet_struct packet_struct = pat_health_packet_struct();
@@ -152,7 +177,7 @@ fpga_answer_struct receive_packet_fpga_map_answer(zmq::socket_t& fpga_map_answer
 	
 	if(read_write == WRITE){	
 		char packet[sizeof(fpga_answer_write_packet_struct)];
-		memcpy(packet, message.data(), message.size());
+		memcpy(packet, message.data(), message.size() < sizeof(packet) ? message.size() : sizeof(packet)); //write answers can carry the values written, only the header is used
 		
 		fpga_answer_write_packet_struct packet_struct = fpga_answer_write_packet_struct(); //initialize
 		memcpy(&packet_struct, packet, sizeof(packet));
@@ -21,6 +21,7 @@
 #define SEND_PAT_HEALTH_DATA 1 //flag housekeeping to relay health message to bus
 #define DONT_SEND_PAT_HEALTH_DATA 0 //flag housekeeping to ignore health message
 #define FPGA_READ_SIZE 4
+#define FPGA_WRITE_BLOCK_MAX 4 //registers written by one block write request
 #define CMD_PAYLOAD_SIZE 256
 //command list:
 #define CMD_START_PAT 0x00
@@ -79,6 +80,15 @@ struct fpga_request_write_packet_struct{
 	uint8_t data_to_write[4]; //struct alignment forces this to be 4 bytes, so need to add pre-padding since only have 1 byte of significant data
 };
 
+struct fpga_request_write_block_packet_struct{
+	uint32_t return_address;
+	uint8_t request_number;
+	bool read_write_flag;
+	uint16_t start_address;
+	uint32_t data_size;
+	uint8_t data_to_write[4*FPGA_WRITE_BLOCK_MAX]; //4 bytes per register, 16 bit values are pre-padded with 2 bytes, least significant byte first
+};
+
 struct fpga_request_read_packet_struct{
 	uint32_t return_address;
 	uint8_t request_number;
@@ -160,6 +170,8 @@ struct pat_self_test_packet_struct{
 // Packet Sending for PUB Processes:
 void send_packet_fpga_map_request(zmq::socket_t& fpga_map_request_port, bool read_write, uint8_t request_num, uint16_t channel, uint8_t data = 0);
 
+void send_packet_fpga_map_write_block(zmq::socket_t& fpga_map_request_port, uint8_t request_num, uint16_t start_channel, uint16_t* data, uint8_t count);
+
 void send_packet_pat_health(zmq::socket_t& pat_health_port, char* data = NULL);
 
 void send_packet_pat_status(zmq::socket_t& pat_status_port, uint32_t status);
@@ -55,19 +55,19 @@ def test_calib_laser(fo):
     power.heater_1_off()
     power.heater_2_off()
     time.sleep(.25)
-    heater_off_curr = sum([fpga.read_reg(mmap.HEATER_CURRENT) for i in range(avg_len)])/avg_len
+    heater_off_curr = fpga.oversample(mmap.HEATER_CURRENT, avg_len)[0]
     fo.write('OFF: %f A\n' % heater_off_curr)
     
     power.heaters_on()
     time.sleep(.1)
-    heater_only_curr = sum([fpga.read_reg(mmap.HEATER_CURRENT) for i in range(avg_len)])/avg_len
+    heater_only_curr = fpga.oversample(mmap.HEATER_CURRENT, avg_len)[0]
     fo.write('Heater Circuit: %f A\n' % heater_only_curr)
 
     power.calib_diode_on()
     fpga.write_reg(mmap.DAC_SETUP,1)
     fpga.write_reg(mmap.DAC_1_D, options.CAL_LASER_DAC_SETTING)
     time.sleep(.1)
-    calib_curr = sum([fpga.read_reg(mmap.HEATER_CURRENT) for i in range(avg_len)])/avg_len
+    calib_curr = fpga.oversample(mmap.HEATER_CURRENT, avg_len)[0]
     fo.write('Heater Circuit + Cal Laser: %f A\n' % calib_curr)
         
     tosa_temp = fpga.read_reg(mmap.TOSA_TEMP)  
@@ -111,30 +111,27 @@ def test_seed(fo):
     power.bias_off()
 
     time.sleep(.1)
-    off_curr = sum([fpga.read_reg(mmap.LD_CURRENT) for i in range(avg_len)])/avg_len
+    off_curr = fpga.oversample(mmap.LD_CURRENT, avg_len)[0]
     fo.write('OFF: %f A\n' % off_curr)
 
     power.edfa_on()
     power.bias_on()
     power.tec_on()
     time.sleep(1)
-    standby_curr = sum([fpga.read_reg(mmap.LD_CURRENT) for i in range(avg_len)])/avg_len
+    standby_curr = fpga.oversample(mmap.LD_CURRENT, avg_len)[0]
     fo.write('Standby: %f A\n' % standby_curr)
 
-    fpga.write_reg(mmap.EDFA_IN_STR ,'mode acc\r')
-    time.sleep(0.1)
-    fpga.write_reg(mmap.EDFA_IN_STR ,'ldc ba 2200\r')
-    time.sleep(0.1)
-    fpga.write_reg(mmap.EDFA_IN_STR ,'edfa on\r')
+    # Queued back-to-back by the FPGA server, each future completes with the EDFA reply
+    fpga.wait_all(*[fpga.edfa.send_command_async(cmd) for cmd in ('mode acc\r','ldc ba 2200\r','edfa on\r')])
     time.sleep(2)
-    on_curr = sum([fpga.read_reg(mmap.LD_CURRENT) for i in range(avg_len)])/avg_len
+    on_curr = fpga.oversample(mmap.LD_CURRENT, avg_len)[0]
     fo.write('ON: %f A\n' % on_curr)
 
     tosa_temp = fpga.read_reg(mmap.TOSA_TEMP)  
     success = True
     # Bound Checks (update as needed during ground testing)
     for i in range(10):
-        avg_on_curr = sum([fpga.read_reg(mmap.LD_CURRENT) for i in range(avg_len)])/avg_len
+        avg_on_curr = fpga.oversample(mmap.LD_CURRENT, avg_len)[0]
         time.sleep(.1)
         limit = .600 + .01*fpga.read_reg(mmap.TOSA_TEMP) #TBR Temperature Variation (Agrees w/ 26.5C data)
         if(avg_on_curr > limit or avg_on_curr < 100e-3):
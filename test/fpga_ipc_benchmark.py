@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+'''
+Benchmark of the FPGA IPC stack: ipc_helper clients against a running fpga/fpga.py.
+Runs against flight hardware or the simulated bus (options.IPC_USES_SIM).
+
+Measures
+- latency histogram and p50/p99/max of single register reads, and writes on the simulated bus only
+- latency of block reads as the block size grows
+- throughput of async reads as the number of requests in flight grows
+- throughput with several concurrent clients
+- latency of virtual register reads (ADC conversions, EDFA, telemetry, diagnostics)
+
+Results are written as JSON, and can be compared with a previous run:
+    python fpga_ipc_benchmark.py -o new.json -c baseline.json
+'''
+from __future__ import print_function
+import sys
+sys.path.append('/root/lib/')
+import ipc_helper
+import fpga_map as mmap
+import options
+import argparse
+import multiprocessing
+import platform
+import subprocess
+import json
+import time
+
+# Upper bounds of the latency histogram bins, seconds
+HISTOGRAM_BINS = [50e-6, 100e-6, 200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3, 50e-3, 100e-3, float('inf')]
+
+BLOCK_START = mmap.SCTa # BIST counters, reading them has no side effect
+
+# Free running counter: volatile, so never served by the server shadow cache, and reading it has no side effect.
+# PAT polls it, so it is only written on the simulated bus: the benchmark writes nothing on flight hardware
+SINGLE_REG = mmap.FRC
+BLOCK_SIZES = [1, 2, 4, 8, 16]
+ASYNC_DEPTHS = [1, 2, 4, 8, 16, 32, 64]
+CLIENT_COUNTS = [1, 2, 4]
+
+VIRTUAL_REGS = [
+    ('temperature', mmap.PD_TEMP, 1),
+    ('temperature_block', mmap.TEMPERATURE_BLOCK[0], len(mmap.TEMPERATURE_BLOCK)),
+    ('current_block', mmap.CURRENT_BLOCK[0], len(mmap.CURRENT_BLOCK)),
+    ('edfa_power_in', mmap.EDFA_POWER_IN, 1),
+    ('fpga_telem', mmap.FPGA_TELEM, 1),
+    ('spi_stats', mmap.SPI_STATS_BLOCK[0], len(mmap.SPI_STATS_BLOCK))]
+
+def percentile(ordered, pct):
+    '''Nearest rank percentile of a sorted list'''
+    if not ordered: return None
+    rank = int(round(pct/100.0*(len(ordered)-1)))
+    return ordered[rank]
+
+def summarize(latencies, elapsed=None):
+    ordered = sorted(latencies)
+    histogram = [0]*len(HISTOGRAM_BINS)
+    for latency in ordered:
+        for idx, bound in enumerate(HISTOGRAM_BINS):
+            if latency <= bound:
+                histogram[idx] += 1
+                break
+    result = {
+        'count': len(ordered),
+        'p50': percentile(ordered, 50),
+        'p99': percentile(ordered, 99),
+        'max': ordered[-1] if ordered else None,
+        'mean': sum(ordered)/len(ordered) if ordered else None,
+        'histogram': [['<=%g' % bound, n] for bound, n in zip(HISTOGRAM_BINS, histogram)]}
+    if elapsed is None: elapsed = sum(ordered)
+    if elapsed: result['throughput'] = len(ordered)/elapsed
+    return result
+
+def time_calls(call, iterations):
+    latencies = []
+    for i in xrange(iterations):
+        start = time.time()
+        call()
+        latencies.append(time.time() - start)
+    return latencies
+
+def bench_single(fpga, iterations):
+    results = {'read': summarize(time_calls(lambda: fpga.read_reg(SINGLE_REG), iterations))}
+    if getattr(options, 'IPC_USES_SIM', 0):
+        results['write'] = summarize(time_calls(lambda: fpga.write_reg(SINGLE_REG, 0), iterations))
+    return results
+
+def bench_blocks(fpga, iterations):
+    results = {}
+    for size in BLOCK_SIZES:
+        result = summarize(time_calls(lambda: fpga.read_reg(BLOCK_START, size), iterations))
+        result['registers_per_s'] = result['throughput']*size
+        results[str(size)] = result
+    return results
+
+def bench_async(fpga, iterations):
+    results = {}
+    for depth in ASYNC_DEPTHS:
+        rounds = max(1, iterations//depth)
+        latencies = []
+        start = time.time()
+        for i in xrange(rounds):
+            issued = time.time()
+            futures = [fpga.read_reg_async(SINGLE_REG) for n in xrange(depth)]
+            for future in futures:
+                future.wait()
+                latencies.append(time.time() - issued)
+        results[str(depth)] = summarize(latencies, time.time() - start)
+    return results
+
+def _client_worker(duration, results):
+    # Each process needs its own client and ZMQ context
+    fpga = ipc_helper.FPGAClientInterface()
+    latencies = []
+    end = time.time() + duration
+    while time.time() < end:
+        start = time.time()
+        fpga.read_reg(SINGLE_REG)
+        latencies.append(time.time() - start)
+    results.put(latencies)
+
+def bench_clients(duration):
+    results = {}
+    for count in CLIENT_COUNTS:
+        queue = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_client_worker, args=(duration, queue)) for n in xrange(count)]
+        for worker in workers: worker.start()
+        latencies = []
+        for worker in workers: latencies += queue.get()
+        for worker in workers: worker.join()
+        results[str(count)] = summarize(latencies, duration)
+    return results
+
+def bench_virtual(fpga, iterations):
+    results = {}
+    for name, addr, size in VIRTUAL_REGS:
+        results[name] = summarize(time_calls(lambda: fpga.read_reg(addr, size), iterations))
+    return results
+
+def build_info():
+    try: commit = subprocess.check_output(['git', 'describe', '--always', '--dirty']).strip()
+    except (OSError, subprocess.CalledProcessError): commit = None
+    return {
+        'commit': commit,
+        'host': platform.node(),
+        'python': platform.python_version(),
+        'time': time.time(),
+        'simulated_bus': bool(getattr(options, 'IPC_USES_SIM', 0))}
+
+# Metrics compared between runs: (path in the results, True if higher is better)
+def _metrics(results, path=()):
+    for key, value in results.items():
+        if isinstance(value, dict):
+            if key == 'histogram': continue
+            for metric in _metrics(value, path + (key,)): yield metric
+        elif key in ('p50', 'p99', 'max'):
+            yield path + (key,), value, False
+        elif key in ('throughput', 'registers_per_s'):
+            yield path + (key,), value, True
+
+def compare(results, baseline):
+    '''Print the relative change of every latency and throughput metric'''
+    reference = dict([(path, value) for path, value, higher in _metrics(baseline)])
+    for path, value, higher in sorted(_metrics(results)):
+        old = reference.get(path)
+        if not old or value is None: continue
+        change = (value - old)/old*100
+        if change == 0: verdict = 'same'
+        elif (change > 0) == higher: verdict = 'better'
+        else: verdict = 'worse'
+        print('%-45s %12.6g -> %12.6g  %+7.1f%% %s' % ('/'.join(path), old, value, change, verdict))
+
+def print_summary(name, result):
+    line = '%-30s p50 %8.3f ms  p99 %8.3f ms  max %8.3f ms' % (name, result['p50']*1e3, result['p99']*1e3, result['max']*1e3)
+    if 'throughput' in result: line += '  %10.1f /s' % result['throughput']
+    print(line)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='FPGA IPC benchmark')
+    parser.add_argument('-n', '--iterations', type=int, default=1000, help='requests per measurement')
+    parser.add_argument('-d', '--duration', type=float, default=5.0, help='seconds per concurrent clients measurement')
+    parser.add_argument('-o', '--output', default='fpga_ipc_benchmark.json', help='JSON results file')
+    parser.add_argument('-c', '--compare', help='JSON results of a previous run to compare with')
+    args = parser.parse_args()
+
+    fpga = ipc_helper.FPGAClientInterface()
+
+    results = {'build': build_info()}
+    results['single'] = bench_single(fpga, args.iterations)
+    results['block'] = bench_blocks(fpga, args.iterations)
+    results['async'] = bench_async(fpga, args.iterations)
+    results['clients'] = bench_clients(args.duration)
+    results['virtual'] = bench_virtual(fpga, args.iterations)
+
+    for section in ['single', 'block', 'async', 'clients', 'virtual']:
+        for name in sorted(results[section]):
+            print_summary('%s/%s' % (section, name), results[section][name])
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print('Results written to %s' % args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        baseline.pop('build', None)
+        results.pop('build')
+        compare(results, baseline)
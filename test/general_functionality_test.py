@@ -32,6 +32,10 @@ def pass_test(fo):
 def fail_test(fo):
     print('Fail')
     fo.write('--- Fail ---\n')
+def laser_state(fpga):
+    '''Bias current, TEC current, TEC readback and regs 1-4, read in one request'''
+    bias, tec, ltr_msb, ltr_lsb, reg1, reg2, reg3, reg4 = fpga.read_regs([mmap.LD_CURRENT, mmap.TEC_CURRENT, mmap.LTRa, mmap.LTRb, 1, 2, 3, 4])
+    return (bias, tec, ltr_msb*256 + ltr_lsb, reg1, reg2, reg3, reg4)
 
 def error_to_file(func):
     def e_to_f(fo):
@@ -56,7 +60,7 @@ def test_basic_fpga_if(fo):
     fo.write('Writing %s, with %s then %s\n' % (mmap.SCP,v1,v2))
     fpga.write_reg(mmap.SCP, v1)
     fpga.write_reg(mmap.SCP, v2)
-    vo = fpga.read_reg(mmap.SCP)
+    vo = fpga.read_reg(mmap.SCP,uncached=True)
     fo.write('Reading %s, got %s\n' % (mmap.SCP,vo))
     assert vo == v2
     
@@ -65,7 +69,7 @@ def test_basic_fpga_if(fo):
     fo.write('Writing %s, with %s then %s\n' % (mmap.SCP,v1,v2))
     fpga.write_reg(mmap.SCP, v1)
     fpga.write_reg(mmap.SCP, v2)
-    vo = fpga.read_reg(mmap.SCP,len(v2))
+    vo = fpga.read_reg(mmap.SCP,len(v2),uncached=True)
     fo.write('Reading %s, got %s\n' % (mmap.SCP,vo))
     assert vo == v2
     
@@ -87,7 +91,7 @@ def test_fpga_if_performance(fo):
     start_single = time.time()
     for i in xrange(1000):
         try:
-            vo = fpga.read_reg(mmap.SCP)
+            vo = fpga.read_reg(mmap.SCP,uncached=True)
         except:
             success = False
             fo.write('IO Error at itteration %d\n' % (i))
@@ -106,7 +110,7 @@ def test_fpga_if_performance(fo):
     start_block = time.time()
     for i in xrange(1000):
         try:
-            vo = fpga.read_reg(mmap.SCP,len(v1))
+            vo = fpga.read_reg(mmap.SCP,len(v1),uncached=True)
         except:
             success = False
             fo.write('IO Error at itteration %d\n' % (i))
@@ -126,7 +130,7 @@ def test_fpga_if_performance(fo):
     vol = []
     for i in xrange(1000):
         try:
-            vol.append([fpga.read_reg_async(mmap.SCP),i])
+            vol.append([fpga.read_reg_async(mmap.SCP,uncached=True),i])
         except:
             success = False
             fo.write('IO Error at itteration %d\n' % (i))
@@ -302,6 +306,7 @@ def reflash_fpga(fo):
 
     os.system("systemctl start --user flash-fpga.service")
     time.sleep(5)
+    fpga.write_reg(mmap.CACHE_FLUSH, 1)
 
     power_switches = [mmap.CAL, mmap.PO1, mmap.PO2, mmap.PO3, mmap.PO4, mmap.HE1, mmap.HE2]
 
@@ -450,7 +455,7 @@ def test_tec_driver(fo):
 
         for y in range(10):
             avg_len = 10
-            on_curr = sum([fpga.read_reg(mmap.TEC_CURRENT) for x in range(avg_len)])/avg_len
+            on_curr = fpga.oversample(mmap.TEC_CURRENT, avg_len)[0]
 
             limit = .300 + .007*fpga.read_reg(mmap.TOSA_TEMP)
 
@@ -521,7 +526,7 @@ def test_bias_driver(fo):
     success = True
     for i in range(10):
         avg_len = 10
-        avg_on_curr = sum([fpga.read_reg(mmap.LD_CURRENT) for i in range(avg_len)])/avg_len
+        avg_on_curr = fpga.oversample(mmap.LD_CURRENT, avg_len)[0]
         time.sleep(.1)
 
         limit = .600 + .01*fpga.read_reg(mmap.TOSA_TEMP)
@@ -577,16 +582,14 @@ def test_scan_PPM(fo):
                 success = False
                 fo.write("PPM%s input power to the edfa is outside of nominal range: %s \n" % (ppm, edfa_input))
                 fo.write("Bias Curr: %s TEC Curr: %s TEC_ReadBack: %s REG 1-4 %s, %s, %s, %s, PPM_ORDER: %s\n" % \
-                (fpga.read_reg(mmap.LD_CURRENT), fpga.read_reg(mmap.TEC_CURRENT), fpga.read_reg(mmap.LTRa)*256 + fpga.read_reg(mmap.LTRb), \
-                fpga.read_reg(1),fpga.read_reg(2), fpga.read_reg(3), fpga.read_reg(4), ppm_order))
+                (laser_state(fpga) + (ppm_order,)))
         else:
             expected_input = baseline_input - 3.0
             if (abs(edfa_input-expected_input)) > .5:
                 success = False
                 fo.write("PPM%s was outside of the acceptable range of input power to the EDFA: %s \n" % (ppm, edfa_input))
                 fo.write("Bias Curr: %s TEC Curr: %s TEC_ReadBack: %s REG 1-4 %s, %s, %s, %s\n" % \
-                (fpga.read_reg(mmap.LD_CURRENT), fpga.read_reg(mmap.TEC_CURRENT), fpga.read_reg(mmap.LTRa)*256 + fpga.read_reg(mmap.LTRb), \
-                fpga.read_reg(1),fpga.read_reg(2), fpga.read_reg(3), fpga.read_reg(4)))
+                laser_state(fpga))
             baseline_input = edfa_input
 
     power.edfa_off()
@@ -632,8 +635,7 @@ def check_CW_power(fo):
     else:
         fo.write("EDFA Input Power outside of expected range: "+str(input_power)+" dbm \n")
         fo.write("Bias Curr: %s TEC Curr: %s TEC_ReadBack: %s REG 1-4 %s, %s, %s, %s\n" % \
-        (fpga.read_reg(mmap.LD_CURRENT), fpga.read_reg(mmap.TEC_CURRENT), fpga.read_reg(mmap.LTRa)*256 + fpga.read_reg(mmap.LTRb), \
-        fpga.read_reg(1),fpga.read_reg(2), fpga.read_reg(3), fpga.read_reg(4)))
+        laser_state(fpga))
         fail_test(fo)
         print("EDFA Input Power outside of expected range: "+str(input_power)+" dbm")
 